@@ -20,13 +20,95 @@ class Settings(BaseSettings):
     MAX_RESULTS: int = 500
     PAGE_SIZE: int = 20
     MAX_PAGES_PER_QUERY: int = 1000  # da sua env
+    SCRAPER_WORKERS: int = 0          # processos de scraping (cada um com seu Chromium); 0 = no processo da API
+    SCRAPER_GOOGLE_BASE_URL: str = "https://www.google.com"
+    SCRAPER_DEFAULT_UF: str = "MG"    # UF das variações de termo quando a cidade não tem alias conhecido
+    # Ordenação adaptativa das variações de termo pelo rendimento histórico
+    VARIANT_MIN_PAGES: int = 30           # histórico mínimo antes de julgar um padrão
+    VARIANT_LOW_YIELD_RATIO: float = 0.25  # abaixo disso x média global = padrão fraco
+    VARIANT_LOW_YIELD_EMPTY_PAGES: int = 2  # padrão fraco desiste após N páginas vazias
+    SCRAPER_ENGINE: str = "browser"   # "http": tenta httpx antes e só usa o Chromium quando precisa
+    SCRAPER_HTTP_TIMEOUT: float = 15.0
+    SCRAPER_HTTP_MAX_CONNECTIONS: int = 10
+    SCRAPER_HTTP_MAX_KEEPALIVE: int = 5
+    SCRAPER_PAGE_POOL_SIZE: int = 4   # páginas quentes por contexto (mín. 2: SERP + ficha)
+    SCRAPER_WARM_CONTEXTS: int = 0    # contextos ociosos mantidos no browser p/ próximas buscas
+    SCRAPER_CONCURRENCY: int = 3      # workers (páginas em paralelo) por busca
+    SCRAPER_PAGES_PER_TERM: int = 2   # páginas do mesmo termo em voo ao mesmo tempo
+    SCRAPER_BROWSER_CONCURRENCY: int = 6  # teto de páginas carregando no browser, somando todas as buscas
+    SCRAPER_LISTING_CONCURRENCY: int = 4  # fichas abertas em paralelo por busca
+    # Governador de ritmo (por processo): páginas da SERP/min no Google, rajada e piso após bloqueios
+    SCRAPER_RATE_PER_MIN: float = 600.0
+    SCRAPER_BURST: int = 30
+    SCRAPER_MIN_RATE_PER_MIN: float = 4.0
+    LISTING_CACHE_TTL_SEC: int = 21600    # memo de telefones por ficha (ludocid/lrd)
+    LISTING_CACHE_MAX: int = 20000
+    # Interceptação (listas separadas por vírgula; URL casa por substring)
+    SCRAPER_BLOCK_RESOURCES: bool = True
+    SCRAPER_BLOCK_RESOURCE_TYPES: str = "image,media,font,stylesheet"
+    SCRAPER_BLOCK_URL_PATTERNS: str = ("googletagmanager.com,google-analytics.com,doubleclick.net,"
+                                       "googlesyndication.com,/gen_204,/client_204,/log?,/maps/vt,"
+                                       "/maps/api/staticmap,khms,/xjs/_/ss/")
+    SCRAPER_ALLOW_URL_PATTERNS: str = ""  # vence o bloqueio (ex.: "recaptcha" p/ depurar captcha)
+    # Cache de SERP (mesmo banco do auth)
+    SERP_CACHE_ENABLED: bool = True
+    SERP_CACHE_TTL_SEC: int = 86400
+    SERP_CACHE_EMPTY_TTL_SEC: int = 900  # página sem telefone nem ficha: TTL curto
+    SERP_CACHE_MAX_ENTRIES: int = 50000
+    # Pipeline scraping → verificação do /leads
+    PIPELINE_VERIFY_WORKERS: int = 3  # consumidores que verificam enquanto o scraping segue
+    PIPELINE_QUEUE_MAX: int = 200     # candidatos aguardando verificação (fila limitada)
+    SINGLEFLIGHT_ENABLED: bool = True  # buscas idênticas simultâneas compartilham o mesmo pipeline
+    # Várias cidades numa busca: `local` repetido ou separado por ";"; um nome de região
+    # vira as cidades dela ("nome=Cidade A|Cidade B;outra=..."). Cada cidade é varrida em paralelo.
+    REGIONS: str = ("grande bh=Belo Horizonte, MG|Contagem, MG|Betim, MG|Nova Lima, MG;"
+                    "grande sp=São Paulo, SP|Guarulhos, SP|Osasco, SP|Santo André, SP|São Bernardo do Campo, SP;"
+                    "grande rio=Rio de Janeiro, RJ|Niterói, RJ|São Gonçalo, RJ|Duque de Caxias, RJ;"
+                    "grande poa=Porto Alegre, RS|Canoas, RS|Gravataí, RS|Viamão, RS")
+    MAX_CITIES_PER_SEARCH: int = 8
+    SCAN_CURSOR_TTL_SEC: int = 3600    # cursor de varredura (?cursor=) disponível para continuar a busca
+    SCAN_CURSOR_MAX: int = 500
+    LIKELIHOOD_DEFER_BELOW: float = 0.2  # chance de WA abaixo disso: verifica só no fim (ex.: fixo)
+    LIKELIHOOD_NEAR_TARGET: float = 0.8  # a partir desta fração de n, improváveis são descartados
+
+    # Jobs em segundo plano (/jobs)
+    JOBS_WORKERS: int = 2             # jobs rodando ao mesmo tempo neste processo
+    JOBS_RETENTION_DAYS: int = 7      # jobs/eventos mais antigos são apagados no startup
 
     # Verifier
+    # várias instâncias: "url|token[|max_concorrência]" separados por vírgula;
+    # vazio = só o par UAZAPI_CHECK_URL/UAZAPI_INSTANCE_TOKEN
+    UAZAPI_INSTANCES: str = ""
     UAZAPI_BATCH_SIZE: int = 50
-    UAZAPI_MAX_CONCURRENCY: int = 2
+    UAZAPI_MAX_CONCURRENCY: int = 2       # concorrência inicial; o limiter AIMD ajusta em uso
+    UAZAPI_CONCURRENCY_MAX: int = 8
+    UAZAPI_TARGET_LATENCY_MS: int = 4000  # acima disso (por lote) a concorrência/lote diminuem
+    UAZAPI_BATCH_SIZE_MIN: int = 10
+    UAZAPI_BATCH_SIZE_MAX: int = 200
     UAZAPI_RETRIES: int = 3
     UAZAPI_THROTTLE_MS: int = 250
     UAZAPI_TIMEOUT: float = 15.0
+    UAZAPI_BREAKER_FAILURES: int = 5      # falhas seguidas (5xx/timeout/rede) até abrir o disjuntor
+    UAZAPI_BREAKER_OPEN_SEC: float = 30.0  # tempo aberto antes da sonda (half-open)
+    UAZAPI_BREAKER_HALF_OPEN_PROBES: int = 1
+    UAZAPI_MICROBATCH: bool = True        # junta números de streams concorrentes no mesmo POST
+    UAZAPI_BATCH_MAX_WAIT_MS: int = 150   # espera máx. para completar um lote
+    # clientes HTTP compartilhados pelo processo (criados no lifespan)
+    UAZAPI_MAX_CONNECTIONS: int = 20
+    UAZAPI_MAX_KEEPALIVE: int = 10
+    UAZAPI_KEEPALIVE_EXPIRY: float = 60.0
+    WA_ME_MAX_CONNECTIONS: int = 10
+    WA_ME_MAX_KEEPALIVE: int = 5
+    # segundo passe wa.me: revalida os 'bad' da UAZAPI; teto global e cache dos resultados
+    WA_ME_SECOND_PASS: int = 0
+    WA_ME_CONCURRENCY: int = 4
+    WA_ME_CACHE_TTL_SEC: int = 86400
+    WA_ME_CACHE_MAX: int = 50000
+    # Cache de status WA (memória + banco do auth)
+    WA_CACHE_ENABLED: bool = True
+    WA_CACHE_TTL_POSITIVE_SEC: int = 30 * 86400
+    WA_CACHE_TTL_NEGATIVE_SEC: int = 7 * 86400
+    WA_CACHE_MEMORY_MAX: int = 200000
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,326 @@
+# app/jobs.py
+# Jobs de leads em segundo plano: POST /jobs enfileira, workers do processo rodam o
+# LeadPipeline e gravam cada evento (com seq) no banco do auth. GET /jobs/{id}/stream
+# reenvia a partir do Last-Event-ID e continua ao vivo — queda de conexão não perde o trabalho.
+import asyncio
+import json
+import time
+import uuid
+from asyncio import CancelledError
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, UniqueConstraint, select, delete, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from .auth import Base, SessionLocal, engine, verify_access_via_query
+from .config import settings
+from .services.pipeline import LeadPipeline, cidades_from_local
+from .services.scraper import ScrapeStats
+from .utils.csv_export import csv_stream_response, export_filename
+from .utils.sse import KEEPALIVE_SEC, sse
+
+class LeadJob(Base):
+    __tablename__ = "lead_jobs"
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, index=True, nullable=False)
+    nicho = Column(String(255), nullable=False)
+    local = Column(String(255), nullable=False)
+    n = Column(Integer, nullable=False)
+    verify = Column(Boolean, default=False)
+    status = Column(String(16), nullable=False, default="queued")  # queued|running|done|error|interrupted
+    summary = Column(Text)  # JSON do evento done
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class LeadJobEvent(Base):
+    __tablename__ = "lead_job_events"
+    __table_args__ = (UniqueConstraint("job_id", "seq"),)
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String(32), index=True, nullable=False)
+    seq = Column(Integer, nullable=False)
+    event = Column(String(32), nullable=False)
+    data = Column(Text, nullable=False)
+
+Base.metadata.create_all(engine)
+
+FINAL_STATUSES = ("done", "error", "interrupted")
+FLUSH_EVERY = 50     # eventos por escrita no banco
+FLUSH_SEC = 1.0
+STATUS_POLL_SEC = 2.0
+EXPORT_PAGE = 500
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+class JobIn(BaseModel):
+    nicho: str
+    local: str
+    n: int = Field(..., ge=1, le=min(500, settings.MAX_RESULTS))
+    verify: int = 0
+
+# ---------- banco (sempre via asyncio.to_thread) ----------
+def _job_dict(j: LeadJob) -> dict:
+    return {
+        "id": j.id, "status": j.status, "nicho": j.nicho, "local": j.local, "n": j.n,
+        "verify": int(bool(j.verify)),
+        "summary": json.loads(j.summary) if j.summary else None,
+        "created_at": j.created_at.isoformat() if j.created_at else None,
+        "updated_at": j.updated_at.isoformat() if j.updated_at else None,
+    }
+
+def _create_sync(uid: int, body: JobIn) -> dict:
+    with SessionLocal() as s:
+        job = LeadJob(id=uuid.uuid4().hex, user_id=uid, nicho=body.nicho.strip(), local=body.local.strip(),
+                      n=body.n, verify=body.verify == 1, status="queued")
+        s.add(job)
+        s.commit()
+        return _job_dict(job)
+
+def _get_sync(job_id: str) -> Optional[Tuple[int, dict]]:
+    with SessionLocal() as s:
+        job = s.get(LeadJob, job_id)
+        return (job.user_id, _job_dict(job)) if job else None
+
+def _set_status_sync(job_id: str, status: str, summary: Optional[dict] = None) -> None:
+    values = {"status": status, "updated_at": datetime.utcnow()}
+    if summary is not None:
+        values["summary"] = json.dumps(summary, ensure_ascii=False)
+    with SessionLocal() as s:
+        s.execute(update(LeadJob).where(LeadJob.id == job_id).values(**values))
+        s.commit()
+
+def _save_events_sync(job_id: str, rows: List[Tuple[int, str, dict]]) -> None:
+    with SessionLocal() as s:
+        s.add_all([LeadJobEvent(job_id=job_id, seq=seq, event=ev, data=json.dumps(data, ensure_ascii=False))
+                   for seq, ev, data in rows])
+        s.commit()
+
+def _load_events_sync(
+    job_id: str, after: int, event: Optional[str] = None, limit: Optional[int] = None
+) -> List[Tuple[int, str, dict]]:
+    q = select(LeadJobEvent.seq, LeadJobEvent.event, LeadJobEvent.data).where(
+        LeadJobEvent.job_id == job_id, LeadJobEvent.seq > after)
+    if event:
+        q = q.where(LeadJobEvent.event == event)
+    if limit:
+        q = q.limit(limit)
+    with SessionLocal() as s:
+        return [(seq, ev, json.loads(data)) for seq, ev, data in s.execute(q.order_by(LeadJobEvent.seq)).all()]
+
+def _recover_sync() -> List[str]:
+    """No startup: 'running' de um processo anterior vira 'interrupted'; 'queued' volta para a fila."""
+    cutoff = datetime.utcnow() - timedelta(days=int(settings.JOBS_RETENTION_DAYS))
+    with SessionLocal() as s:
+        old = select(LeadJob.id).where(LeadJob.created_at < cutoff)
+        s.execute(delete(LeadJobEvent).where(LeadJobEvent.job_id.in_(old)))
+        s.execute(delete(LeadJob).where(LeadJob.created_at < cutoff))
+        s.execute(update(LeadJob).where(LeadJob.status == "running")
+                  .values(status="interrupted", updated_at=datetime.utcnow()))
+        queued = s.execute(select(LeadJob.id).where(LeadJob.status == "queued")
+                           .order_by(LeadJob.created_at)).scalars().all()
+        s.commit()
+        return list(queued)
+
+# ---------- execução ----------
+class _JobRun:
+    """Job rodando neste processo: eventos em memória (para o ao vivo) + gravação em lotes."""
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.events: List[Tuple[int, str, dict]] = []
+        self.finished = False
+        self.pipeline: Optional[LeadPipeline] = None
+        self.changed = asyncio.Condition()
+        self._unsaved: List[Tuple[int, str, dict]] = []
+        self._saved_at = time.monotonic()
+
+    async def publish(self, event: str, data: dict) -> None:
+        item = (len(self.events) + 1, event, data)
+        self.events.append(item)
+        self._unsaved.append(item)
+        async with self.changed:
+            self.changed.notify_all()
+        if len(self._unsaved) >= FLUSH_EVERY or time.monotonic() - self._saved_at >= FLUSH_SEC:
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows, self._unsaved = self._unsaved, []
+        self._saved_at = time.monotonic()
+        if rows:
+            try:
+                await asyncio.to_thread(_save_events_sync, self.id, rows)
+            except SQLAlchemyError:
+                self._unsaved = rows + self._unsaved  # tenta de novo na próxima
+
+    async def finish(self) -> None:
+        self.finished = True
+        async with self.changed:
+            self.changed.notify_all()
+
+_runs: Dict[str, _JobRun] = {}
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+async def _run_job(job_id: str) -> None:
+    found = await asyncio.to_thread(_get_sync, job_id)
+    if found is None:
+        return
+    _, job = found
+    await asyncio.to_thread(_set_status_sync, job_id, "running")
+    run = _runs[job_id] = _JobRun(job_id)
+    cidades = cidades_from_local(job["local"])
+    stats = ScrapeStats()
+    pipe = run.pipeline = LeadPipeline(job["nicho"], cidades, job["n"], verify=bool(job["verify"]), stats=stats)
+    status = "done"
+    try:
+        await run.publish("start", {"message": "started", "job_id": job_id, "cities": cidades})
+        async for event, data in pipe.events():
+            await run.publish(event, data)
+        if pipe.error:
+            status = "error"
+    except CancelledError:
+        status = "interrupted"
+        raise
+    except Exception as e:
+        status = "error"
+        await run.publish("progress", {"error": str(e), **pipe.summary()})
+    finally:
+        summary = {**pipe.summary(), "stats": asdict(stats), "status": status, "job_id": job_id}
+        await run.publish("done", summary)
+        await run.flush()
+        try:
+            await asyncio.to_thread(_set_status_sync, job_id, status, summary)
+        except SQLAlchemyError:
+            pass
+        await run.finish()
+        _runs.pop(job_id, None)
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        except CancelledError:
+            raise
+        except Exception:
+            pass  # status já gravado no finally do job
+
+async def start() -> None:
+    global _queue
+    _queue = asyncio.Queue()
+    _workers[:] = [asyncio.create_task(_worker()) for _ in range(max(1, int(settings.JOBS_WORKERS)))]
+    try:
+        for job_id in await asyncio.to_thread(_recover_sync):
+            _queue.put_nowait(job_id)
+    except SQLAlchemyError:
+        pass
+
+async def stop() -> None:
+    for t in _workers:
+        t.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+# ---------- stream ----------
+async def _stream(job_id: str, last_id: int, status: str):
+    run = _runs.get(job_id)
+    last_beat = time.monotonic()
+    while run is None and status not in FINAL_STATUSES:
+        # na fila (ou rodando em outro processo): espera começar aqui ou terminar
+        await asyncio.sleep(STATUS_POLL_SEC)
+        run = _runs.get(job_id)
+        if run is None:
+            found = await asyncio.to_thread(_get_sync, job_id)
+            status = found[1]["status"] if found else "error"
+        if time.monotonic() - last_beat >= KEEPALIVE_SEC:
+            last_beat = time.monotonic()
+            yield sse("tick", {"ts": int(time.time())})
+    if run is None:
+        # terminado (ou interrompido por restart): replay do que foi gravado
+        rows = await asyncio.to_thread(_load_events_sync, job_id, last_id)
+        for seq, event, data in rows:
+            yield sse(event, data, id=seq)
+        if status == "interrupted" and not any(ev == "done" for _, ev, _ in rows):
+            yield sse("done", {"status": status, "job_id": job_id})
+        return
+
+    idx = min(max(0, last_id), len(run.events))
+    while True:
+        while idx < len(run.events):
+            seq, event, data = run.events[idx]
+            idx += 1
+            yield sse(event, data, id=seq)
+        if run.finished:
+            return
+        timed_out = False
+        async with run.changed:
+            try:
+                await asyncio.wait_for(
+                    run.changed.wait_for(lambda: run.finished or len(run.events) > idx), KEEPALIVE_SEC)
+            except asyncio.TimeoutError:
+                timed_out = True
+        if timed_out:
+            yield sse("tick", {"ts": int(time.time())})
+
+async def _owned_job(job_id: str, uid: int) -> dict:
+    found = await asyncio.to_thread(_get_sync, job_id)
+    if found is None or found[0] != uid:
+        raise HTTPException(404, "job not found")
+    return found[1]
+
+async def _stored_phones(job_id: str):
+    """Telefones já gravados de um job, em páginas (export sem novo scraping)."""
+    after = 0
+    while True:
+        rows = await asyncio.to_thread(_load_events_sync, job_id, after, "item", EXPORT_PAGE)
+        for seq, _, data in rows:
+            after = seq
+            yield data["phone"]
+        if len(rows) < EXPORT_PAGE:
+            return
+
+# ---------- rotas ----------
+@router.post("")
+async def create_job(body: JobIn, auth=Depends(verify_access_via_query)):
+    uid, _sid, _dev = auth
+    job = await asyncio.to_thread(_create_sync, uid, body)
+    _queue.put_nowait(job["id"])
+    return {**job, "stream": f"/jobs/{job['id']}/stream"}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, auth=Depends(verify_access_via_query)):
+    job = await _owned_job(job_id, auth[0])
+    run = _runs.get(job_id)
+    if run is not None and run.pipeline is not None:
+        job["progress"] = run.pipeline.summary()
+        job["events"] = len(run.events)
+    return job
+
+@router.get("/{job_id}/stream")
+async def stream_job(
+    job_id: str,
+    last_event_id: Optional[int] = Query(None),
+    last_event_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    auth=Depends(verify_access_via_query),
+):
+    job = await _owned_job(job_id, auth[0])
+    last_id = last_event_id
+    if last_id is None and last_event_header and last_event_header.strip().isdigit():
+        last_id = int(last_event_header.strip())
+    return StreamingResponse(
+        _stream(job_id, last_id or 0, job["status"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/{job_id}/export")
+async def export_job(job_id: str, auth=Depends(verify_access_via_query)):
+    job = await _owned_job(job_id, auth[0])
+    if job["status"] not in FINAL_STATUSES:
+        raise HTTPException(409, "job not finished")
+    filename = export_filename(job["nicho"], "-".join(cidades_from_local(job["local"])))
+    return csv_stream_response(_stored_phones(job_id), filename)
@@ -1,28 +1,49 @@
 # app/main.py
-import json
-from io import StringIO
-from typing import List
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import List, Optional
 from asyncio import CancelledError
-import asyncio
 
 from fastapi import FastAPI, Query, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from .config import settings
 
 # Import seguro: se shutdown_playwright não existir, define um no-op.
 try:
-    from .services.scraper import search_numbers, shutdown_playwright as _shutdown_playwright
+    from .services.scraper import shutdown_playwright as _shutdown_playwright
 except Exception:
-    from .services.scraper import search_numbers
     async def _shutdown_playwright():
         return
 
-from .services.verifier import verify_batch
-from .auth import router as auth_router, verify_access_via_query
+from .services import verifier
+from .services import serp_cache, serp_http, scrape_workers, variant_stats, wa_cache, wa_likelihood, wa_probe
+from .services.governor import governor
+from .services import scan_cursors, singleflight
+from .services.pipeline import cidades_from_local
+from .auth import router as auth_router, verify_access_via_query, require_admin
+from .jobs import router as jobs_router
+from . import jobs
+from .utils.csv_export import csv_stream_response, export_filename
+from .utils.sse import KEEPALIVE_SEC, sse
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # clientes HTTP e workers vivem o processo inteiro; fechados junto com o Playwright
+    await verifier.start_clients()
+    await scrape_workers.start()
+    await jobs.start()
+    try:
+        yield
+    finally:
+        await jobs.stop()
+        await scrape_workers.stop()
+        await _shutdown_playwright()
+        await serp_http.aclose()
+        await verifier.close_clients()
 
-app = FastAPI(title="ClickLeads Backend", version="2.1.2")
+app = FastAPI(title="ClickLeads Backend", version="2.1.2", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,180 +55,71 @@ app.add_middleware(
 )
 
 app.include_router(auth_router)
-
-KEEPALIVE_SEC = 10  # “tick” periódico no SSE para evitar ficar mudo
-
-def sse(event: str, data: dict) -> str:
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
-
-def _batch_size(n: int) -> int:
-    if n <= 5: return 6
-    if n <= 20: return 10
-    if n <= 100: return 20
-    return 30
-
-def _cidade(local: str) -> str:
-    return (local or "").split(",")[0].strip()
-
-def _scrape_cap(remaining: int, somente_wa: bool) -> int:
-    # quando filtra por WA, precisamos sobre-amostrar
-    return max(remaining * (16 if somente_wa else 1), 300 if somente_wa else 100)
+app.include_router(jobs_router)
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/stats", dependencies=[Depends(require_admin)])
+async def stats():
+    return {
+        "serp_cache": serp_cache.stats(),
+        "scrape_workers": scrape_workers.health(),
+        "scrape_governor": governor.state(),
+        "variant_yield": variant_stats.ranked(await variant_stats.snapshot())[:20],
+        "wa_cache": wa_cache.stats(),
+        "wa_probe": wa_probe.stats(),
+        "wa_likelihood": wa_likelihood.stats(),
+        "singleflight": singleflight.stats(),
+        "scan_cursors": scan_cursors.stats(),
+        "verify_batcher": verifier.batcher_state(),
+        "uazapi_instances": verifier.instances_state(),
+    }
+
 # ================= STREAM =================
 @app.get("/leads/stream")
 async def leads_stream(
     nicho: str = Query(...),
-    local: str = Query(...),
+    local: List[str] = Query(...),
     n: int = Query(..., ge=1, le=min(500, settings.MAX_RESULTS)),
     verify: int = Query(0),
+    cursor: Optional[str] = Query(None),
     auth=Depends(verify_access_via_query),
 ):
     _uid, _sid, _dev = auth
 
     somente_wa = verify == 1
-    cidade = _cidade(local)
+    cidades = cidades_from_local(local)
     target = n
 
     async def gen():
-        delivered = 0
-        non_wa = 0
-        searched = 0
-        vistos = set()
-
-        base_batch = _batch_size(target)
-        min_batch = min(8, base_batch)
-        full_batch = base_batch
+        # buscas idênticas em andamento são compartilhadas (replay + ao vivo, cortado em n);
+        # com várias cidades, cada uma é varrida em paralelo e os eventos "city" saem do pipeline
+        sub = await singleflight.subscribe(nicho, cidades, target, verify=somente_wa, cursor=cursor)
         sent_done = False
 
-        last_beat = asyncio.get_event_loop().time()
-        def maybe_tick():
-            nonlocal last_beat
-            now = asyncio.get_event_loop().time()
-            if now - last_beat >= KEEPALIVE_SEC:
-                last_beat = now
-                return sse("tick", {"ts": int(now)})
-            return None
-
-        async def flush_pool(pool: List[str]):
-            nonlocal delivered, non_wa
-            if not pool:
-                return
-            try:
-                ok, bad = await verify_batch(pool, batch_size=len(pool))
-            except Exception:
-                ok, bad = [], []  # não marca como não-WA em caso de erro
-            non_wa += len(bad)
-            for p in ok:
-                if delivered < target:
-                    delivered += 1
-                    yield sse("item", {"phone": p, "has_whatsapp": True})
-                    if delivered >= target:
-                        break
-            yield sse("progress", {
-                "wa_count": delivered, "non_wa_count": non_wa,
-                "searched": searched, "city": cidade
-            })
+        def done_payload() -> dict:
+            return {**sub.summary(), "stats": asdict(sub.stats)}
 
         try:
-            yield sse("start", {"message": "started"})
-            tick = maybe_tick()
-            if tick: yield tick
-            yield sse("city", {"status": "start", "name": cidade})
-
-            pool: List[str] = []
-
-            # 1ª passada: coleta de candidatos (sobre-amostra se somente_wa)
-            scrape_cap = _scrape_cap(target - delivered, somente_wa)
-            async for ph in search_numbers(nicho, [cidade], scrape_cap, max_pages=None):
-                tick = maybe_tick()
-                if tick: yield tick
-
-                if delivered >= target:
-                    break
-                if not ph or ph in vistos:
-                    continue
-                vistos.add(ph)
-                searched += 1
-
-                if not somente_wa:
-                    delivered += 1
-                    yield sse("item", {"phone": ph})
-                    yield sse("progress", {
-                        "wa_count": delivered, "non_wa_count": non_wa,
-                        "searched": searched, "city": cidade
-                    })
-                    continue
-
-                pool.append(ph)
-                if len(pool) >= min_batch and delivered < target:
-                    async for chunk in flush_pool(pool[:min_batch]): yield chunk
-                    pool = pool[min_batch:]
-                if len(pool) >= full_batch and delivered < target:
-                    async for chunk in flush_pool(pool[:full_batch]): yield chunk
-                    pool = pool[full_batch:]
-
-            # 2ª passada: ainda faltou WA? busca mais candidatos
-            if somente_wa and delivered < target:
-                extra_needed = target - delivered
-                extra_cap = _scrape_cap(extra_needed, True)
-                async for ph in search_numbers(nicho, [cidade], extra_cap, max_pages=None):
-                    tick = maybe_tick()
-                    if tick: yield tick
-
-                    if delivered >= target:
-                        break
-                    if not ph or ph in vistos:
-                        continue
-                    vistos.add(ph)
-                    searched += 1
-                    pool.append(ph)
-                    if len(pool) >= min_batch and delivered < target:
-                        async for chunk in flush_pool(pool[:min_batch]): yield chunk
-                        pool = pool[min_batch:]
-
-            # flush final
-            if somente_wa and pool and delivered < target:
-                async for chunk in flush_pool(pool): yield chunk
-                pool.clear()
-
-            yield sse("city", {"status": "done", "name": cidade})
-            exhausted = delivered < target
-            yield sse("done", {
-                "wa_count": delivered,
-                "non_wa_count": non_wa,
-                "searched": searched,
-                "exhausted": exhausted
+            yield sse("start", {
+                "message": "started", "shared": sub.joined, "resumed": sub.resumed, "cities": cidades,
             })
+            async for event, data in sub.events(keepalive=KEEPALIVE_SEC):
+                yield sse(event, data)
+            yield sse("done", done_payload())
             sent_done = True
 
         except CancelledError:
             return
         except Exception as e:
-            yield sse("progress", {
-                "error": str(e),
-                "wa_count": delivered,
-                "non_wa_count": non_wa,
-                "searched": searched
-            })
-            yield sse("done", {
-                "wa_count": delivered,
-                "non_wa_count": non_wa,
-                "searched": searched,
-                "exhausted": delivered < target
-            })
+            yield sse("progress", {"error": str(e), **sub.summary()})
+            yield sse("done", done_payload())
             sent_done = True
         finally:
             if not sent_done:
-                yield sse("done", {
-                    "wa_count": delivered,
-                    "non_wa_count": non_wa,
-                    "searched": searched,
-                    "exhausted": delivered < target
-                })
+                yield sse("done", done_payload())
 
     return StreamingResponse(
         gen(),
@@ -219,64 +131,22 @@ async def leads_stream(
 @app.get("/leads")
 async def leads(
     nicho: str = Query(...),
-    local: str = Query(...),
+    local: List[str] = Query(...),
     n: int = Query(..., ge=1, le=min(500, settings.MAX_RESULTS)),
     verify: int = Query(0),
+    cursor: Optional[str] = Query(None),
 ):
     somente_wa = verify == 1
-    cidade = _cidade(local)
+    cidades = cidades_from_local(local)
     target = n
 
-    items: List[str] = []
-    delivered = 0
-    non_wa = 0
-    searched = 0
-    vistos = set()
-
-    base_batch = _batch_size(target)
-    min_batch = min(8, base_batch)
-
+    sub = await singleflight.subscribe(nicho, cidades, target, verify=somente_wa, cursor=cursor)
     try:
-        pool: List[str] = []
-
-        # 1ª passada
-        scrape_cap = _scrape_cap(target - delivered, somente_wa)
-        async for ph in search_numbers(nicho, [cidade], scrape_cap, max_pages=None):
-            if delivered >= target: break
-            if not ph or ph in vistos: continue
-            vistos.add(ph); searched += 1
-
-            if not somente_wa:
-                items.append(ph); delivered += 1
-                continue
-
-            pool.append(ph)
-            if len(pool) >= min_batch:
-                try:
-                    ok, bad = await verify_batch(pool[:min_batch], batch_size=min_batch)
-                except Exception:
-                    ok, bad = [], []
-                pool = pool[min_batch:]
-                non_wa += len(bad)
-                for p in ok:
-                    if delivered < target:
-                        items.append(p); delivered += 1
-                        if delivered >= target: break
-
-        # 2ª passada se necessário
-        if somente_wa and delivered < target and pool:
-            try:
-                ok, bad = await verify_batch(pool, batch_size=len(pool))
-            except Exception:
-                ok, bad = [], []
-            non_wa += len(bad)
-            for p in ok:
-                if delivered < target:
-                    items.append(p); delivered += 1
-                    if delivered >= target: break
-
+        items = await sub.collect()
     except Exception:
-        pass
+        items = []
+    summary = sub.summary()
+    delivered, non_wa, searched = summary["wa_count"], summary["non_wa_count"], summary["searched"]
 
     data = [{"phone": p, "has_whatsapp": bool(verify)} for p in items[:target]]
     return JSONResponse({
@@ -284,32 +154,27 @@ async def leads(
         "leads": data,
         "wa_count": delivered,
         "non_wa_count": non_wa,
-        "searched": searched
+        "searched": searched,
+        "verify_unavailable": summary["verify_unavailable"],
+        "cursor": summary["cursor"],
+        "cities": summary["cities"],
     })
 
-def _csv_response(csv_bytes: bytes, filename: str) -> Response:
-    return Response(
-        content=csv_bytes,
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
-
 @app.get("/export")
 async def export_get(
     nicho: str = Query(...),
-    local: str = Query(...),
+    local: List[str] = Query(...),
     n: int = Query(...),
     verify: int = Query(0),
+    cursor: Optional[str] = Query(None),
 ):
-    resp = await leads(nicho=nicho, local=local, n=n, verify=verify)
-    payload = json.loads(resp.body.decode("utf-8"))
-    phones = [row["phone"] for row in payload.get("items", [])]
-    buf = StringIO(); buf.write("phone\n")
-    for p in phones: buf.write(str(p).strip() + "\n")
-    csv = buf.getvalue().encode("utf-8")
-    filename = f"leads_{nicho.strip().replace(' ','_')}_{_cidade(local).replace(' ','_')}.csv"
-    return _csv_response(csv, filename)
+    cidades = cidades_from_local(local)
+    target = max(1, min(n, 500, settings.MAX_RESULTS))
+
+    async def phones():
+        sub = await singleflight.subscribe(nicho, cidades, target, verify=verify == 1, cursor=cursor)
+        async for kind, data in sub.events():
+            if kind == "item":
+                yield data["phone"]
 
-@app.on_event("shutdown")
-async def _shutdown():
-    await _shutdown_playwright()
+    return csv_stream_response(phones(), export_filename(nicho, "-".join(cidades)))
@@ -0,0 +1,77 @@
+# app/services/circuit_breaker.py
+# Disjuntor da UAZAPI: depois de N falhas seguidas (5xx/timeout/rede) abre e recusa chamadas
+# na hora, em vez de cada lote esperar o timeout inteiro. Passado o intervalo, deixa passar
+# uma sonda (half-open): sucesso fecha, falha abre de novo. Sonda cancelada devolve a vaga
+# (release); e uma sonda que nunca reporta expira depois de open_secs.
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, open_secs: float, half_open_probes: int = 1):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_secs = max(0.1, float(open_secs))
+        self.half_open_probes = max(1, int(half_open_probes))
+        self._state = CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probes = 0
+        self.probe_started = 0.0
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() >= self.opened_until:
+            self._state = HALF_OPEN
+            self.probes = 0
+        if self._state == HALF_OPEN and self.probes and time.monotonic() - self.probe_started >= self.open_secs:
+            self.probes = 0  # sonda perdida (sem veredito): libera outra
+        return self._state
+
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """Reserva a chamada; quem recebe True TEM que reportar on_success/on_failure/release."""
+        st = self.state
+        if st == CLOSED:
+            return True
+        if st == HALF_OPEN and self.probes < self.half_open_probes:
+            self.probes += 1
+            self.probe_started = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self) -> None:
+        """Chamada reservada que terminou sem veredito (cancelada): devolve a vaga de sonda."""
+        if self._state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def on_success(self) -> None:
+        self._state = CLOSED
+        self.failures = 0
+        self.probes = 0
+
+    def on_failure(self) -> None:
+        self.failures += 1
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._state = OPEN
+            self.opened_until = time.monotonic() + self.open_secs
+            self.probes = 0
+            self.trips += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in_sec": round(self.retry_in(), 1) if self._state == OPEN else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
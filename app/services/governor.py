@@ -0,0 +1,96 @@
+# app/services/governor.py
+# Governador de ritmo do scraper, único por processo: todas as buscas em voo passam aqui
+# antes de navegar no Google. Token bucket + rastreador de bloqueio (captcha/sorry):
+# bloqueio derruba a taxa pela metade e pausa o processo inteiro; cada página limpa
+# devolve a taxa aos poucos até o teto configurado. O balde cobre só páginas da SERP;
+# fichas abertas a partir dela esperam apenas a pausa de bloqueio.
+import asyncio
+import random
+import time
+
+from ..config import settings
+
+def cooldown_secs(hit: int) -> int:
+    base = 18; mx = 110
+    return min(mx, int(base * (1.6 ** max(0, hit - 1))) + random.randint(0, 9))
+
+class PacingGovernor:
+    RECOVERY_STEP = 0.05  # fração do teto devolvida a cada página sem bloqueio
+
+    def __init__(self, rate_per_min: float, burst: int, min_rate_per_min: float):
+        self.max_rate = max(0.01, float(rate_per_min) / 60.0)
+        self.min_rate = min(self.max_rate, max(0.001, float(min_rate_per_min) / 60.0))
+        self.rate = self.max_rate
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.blocked_until = 0.0
+        self.block_streak = 0
+        self.blocks = 0
+        self.passes = 0
+        self.waited_sec = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Espera a vez de navegar (fila FIFO: quem chegou antes sai antes)."""
+        t0 = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.passes += 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        self.waited_sec += time.monotonic() - t0
+
+    async def wait_unblocked(self) -> None:
+        """Só respeita a pausa de bloqueio, sem gastar ficha (abertura de fichas de empresa)."""
+        t0 = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= self.blocked_until:
+                break
+            await asyncio.sleep(self.blocked_until - now)
+        self.waited_sec += time.monotonic() - t0
+
+    def report_ok(self) -> None:
+        self.block_streak = 0
+        self.rate = min(self.max_rate, self.rate + self.max_rate * self.RECOVERY_STEP)
+
+    def report_block(self) -> None:
+        now = time.monotonic()
+        self.blocks += 1
+        if now < self.blocked_until:
+            return  # mesmo bloqueio visto por outra busca em voo: não escala de novo
+        self.block_streak += 1
+        self.rate = max(self.min_rate, self.rate * 0.5)
+        self.tokens = 0.0
+        self._updated = now
+        self.blocked_until = max(self.blocked_until, now + cooldown_secs(self.block_streak))
+
+    def state(self) -> dict:
+        now = time.monotonic()
+        return {
+            "rate_per_min": round(self.rate * 60, 2),
+            "max_rate_per_min": round(self.max_rate * 60, 2),
+            "blocked_for_sec": round(max(0.0, self.blocked_until - now), 1),
+            "block_streak": self.block_streak,
+            "blocks": self.blocks,
+            "passes": self.passes,
+            "waited_sec": round(self.waited_sec, 1),
+        }
+
+governor = PacingGovernor(
+    settings.SCRAPER_RATE_PER_MIN,
+    settings.SCRAPER_BURST,
+    settings.SCRAPER_MIN_RATE_PER_MIN,
+)
@@ -0,0 +1,480 @@
+# app/services/pipeline.py
+# Pipeline de leads em estágios: scraping (produtor) → fila limitada → verificadores
+# (consumidores) → emissor de eventos. O browser segue paginando enquanto a UAZAPI
+# responde; o produtor só pausa quando o que já está em voo deve bastar para chegar em n.
+# Com várias cidades, cada uma tem sua varredura (uule e cursor próprios) e os telefones
+# são intercalados em rodízio, com dedup global.
+import asyncio
+import itertools
+import uuid
+from asyncio import CancelledError
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from ..config import settings
+from .scraper import BR_UFS, ScanCursor, ScrapeStats
+from .scrape_workers import scrape_numbers
+from . import scan_cursors, wa_likelihood, wa_probe
+from .verifier import VerificationUnavailable, e164, verify_batched_stream
+
+Event = Tuple[str, dict]
+_END = ("_end", {})
+
+def cidade_from_local(local: str) -> str:
+    """"Cidade" ou "Cidade, UF": a UF digitada segue até as variações de termo."""
+    name, _, rest = (local or "").partition(",")
+    name, uf = name.strip(), rest.split(",")[0].strip().upper()
+    return f"{name}, {uf}" if name and uf in BR_UFS else name
+
+def _regions() -> Dict[str, List[str]]:
+    out: Dict[str, List[str]] = {}
+    for entry in (settings.REGIONS or "").split(";"):
+        name, _, cities = entry.partition("=")
+        names = [c.strip() for c in cities.split("|") if c.strip()]
+        if name.strip() and names:
+            out[name.strip().lower()] = names
+    return out
+
+def cidades_from_local(local: Union[str, List[str]]) -> List[str]:
+    """Cidades pedidas: `local` repetido ou com ";"; nome de região (REGIONS) vira as cidades dela."""
+    regions = _regions()
+    out: List[str] = []
+    for raw in ([local] if isinstance(local, str) else list(local or [])):
+        for part in (raw or "").split(";"):
+            for cidade in map(cidade_from_local, regions.get(part.strip().lower()) or [part]):
+                if cidade and cidade.lower() not in {c.lower() for c in out}:
+                    out.append(cidade)
+    return out[:max(1, int(settings.MAX_CITIES_PER_SEARCH))]
+
+async def _uninterrupted(aw) -> None:
+    """
+    Limpeza que não pode parar no meio (fechar varreduras e atualizar cursores): um
+    cancelamento no meio espera ela terminar e só então é repassado.
+    """
+    task = asyncio.ensure_future(aw)
+    cancelled = False
+    while not task.done():
+        try:
+            await asyncio.shield(task)
+        except CancelledError:
+            cancelled = True
+    if cancelled:
+        raise CancelledError
+    task.result()
+
+async def _merge_fair(
+    sources: Dict[str, AsyncGenerator[str, None]],
+    unread: Optional[Callable[[str, str], None]] = None,
+) -> AsyncGenerator[Tuple[str, Optional[str]], None]:
+    """
+    Intercala as varreduras por cidade em rodízio: cada uma tem no máximo um telefone
+    adiantado, então uma cidade rápida não atropela as outras. (cidade, None) = acabou.
+    Ao fechar, o telefone adiantado que ninguém leu vai para `unread(cidade, telefone)`,
+    depois de as varreduras fecharem (e atualizarem seus cursores).
+    """
+    order = list(sources)
+    pending = {c: asyncio.ensure_future(sources[c].__anext__()) for c in order}
+    turn = 0
+    try:
+        while pending:
+            await asyncio.wait(list(pending.values()), return_when=asyncio.FIRST_COMPLETED)
+            for i in range(len(order)):
+                c = order[(turn + i) % len(order)]
+                t = pending.get(c)
+                if t is None or not t.done():
+                    continue
+                try:
+                    ph = t.result()
+                except StopAsyncIteration:
+                    del pending[c]
+                    yield c, None
+                    continue
+                pending[c] = asyncio.ensure_future(sources[c].__anext__())
+                yield c, ph
+            turn = (turn + 1) % len(order)
+    finally:
+        left = [(c, t.result()) for c, t in pending.items()
+                if t.done() and not t.cancelled() and t.exception() is None]
+
+        async def close() -> None:
+            for t in pending.values():
+                t.cancel()
+            await asyncio.gather(*pending.values(), return_exceptions=True)
+            for gen in sources.values():
+                await gen.aclose()
+
+        try:
+            await _uninterrupted(close())
+        finally:
+            if unread is not None:
+                for c, ph in left:
+                    unread(c, ph)
+
+def _batch_size(n: int) -> int:
+    if n <= 5: return 6
+    if n <= 20: return 10
+    if n <= 100: return 20
+    return 30
+
+def _scrape_cap(remaining: int, somente_wa: bool) -> int:
+    # quando filtra por WA, precisamos sobre-amostrar
+    return max(remaining * (16 if somente_wa else 1), 300 if somente_wa else 100)
+
+class LeadPipeline:
+    """
+    Uma busca (nicho + uma ou mais cidades) até n leads. `events()` devolve
+    ("item"|"progress"|"city"|"verify_unavailable", dados);
+    quem chama decide o formato (SSE, JSON...). O resumo final fica em `summary()`.
+    As duas passadas de scraping avançam os mesmos cursores por cidade (vindos de uma
+    busca anterior ou novos); ao terminar ficam guardados e o id sai no resumo.
+    """
+
+    def __init__(
+        self,
+        nicho: str,
+        cidades: Union[str, List[str]],
+        target: int,
+        *,
+        verify: bool,
+        stats: Optional[ScrapeStats] = None,
+        cursors: Optional[Dict[str, ScanCursor]] = None,
+        cursor_id: Optional[str] = None,
+    ):
+        self.nicho = nicho
+        self.cidades = [cidades] if isinstance(cidades, str) else list(cidades)
+        self.cidade = "; ".join(self.cidades)  # rótulo para progress/verify_unavailable
+        self.target = target
+        self.verify = verify
+        self.stats = stats if stats is not None else ScrapeStats()
+        self.cursors = {c: (cursors or {}).get(c) or ScanCursor() for c in self.cidades}
+        self.cursor_id = cursor_id or uuid.uuid4().hex
+        self.resumed = bool(cursors)
+        self.by_city = {c: {"searched": 0, "wa_count": 0, "non_wa_count": 0} for c in self.cidades}
+        self._origin: Dict[str, str] = {}  # telefone (E.164 só dígitos, como volta da UAZAPI) -> cidade
+        self._scraped: Dict[str, str] = {}  # mesmo E.164 -> telefone como saiu do scraping
+        self._cities_done: Set[str] = set()
+        self.delivered = 0
+        self.non_wa = 0
+        self.searched = 0
+        self.wa_hits = 0   # todos os 'ok' da verificação, mesmo os que passaram de n
+        self.inflight = 0  # candidatos na fila + em verificação
+        self.probing = 0   # 'bad' aguardando o segundo passe wa.me
+        self.skipped = 0   # improváveis descartados perto de n (sem gastar UAZAPI)
+        self.seen: Set[str] = set()
+        self.error: Optional[str] = None
+        self.unavailable = False  # disjuntor da UAZAPI abriu: encerra em vez de seguir raspando
+        self._batch = _batch_size(target)
+        # (-chance de WA, ordem, telefone): os consumidores pegam os mais prováveis primeiro
+        self._candidates: asyncio.PriorityQueue = asyncio.PriorityQueue(
+            maxsize=max(self._batch, int(settings.PIPELINE_QUEUE_MAX)))
+        self._order = itertools.count()
+        self._deferred: List[Tuple[float, str]] = []  # improváveis: só depois que o scraping secar
+        self._unverified: Dict[str, str] = {}  # E.164 -> telefone: em verificação ou sem veredito
+        self._leftover: List[str] = []  # improváveis descartados e WA além de n: voltam para o cursor
+        self._out: asyncio.Queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        self._producing = True
+        self.ended = False
+        self._probes: Set[asyncio.Task] = set()
+
+    # ---------- estado ----------
+    @property
+    def full(self) -> bool:
+        return self.delivered >= self.target
+
+    @property
+    def halted(self) -> bool:
+        return self.full or self.unavailable
+
+    def hit_rate(self) -> float:
+        # Laplace: começa em 0.5 e converge para a taxa de WA observada nesta busca
+        return (self.wa_hits + 1) / (self.wa_hits + self.non_wa + 2)
+
+    def _enough_in_flight(self) -> bool:
+        return self.delivered + self.inflight * self.hit_rate() >= self.target
+
+    def _near_target(self) -> bool:
+        return self.delivered >= self.target * float(settings.LIKELIHOOD_NEAR_TARGET)
+
+    def summary(self) -> dict:
+        return {
+            "wa_count": self.delivered,
+            "non_wa_count": self.non_wa,
+            "searched": self.searched,
+            "exhausted": self.delivered < self.target,
+            "verify_unavailable": self.unavailable,
+            "skipped_unlikely": self.skipped,
+            "cursor": None if all(cur.exhausted for cur in self.cursors.values()) else self.cursor_id,
+            "cities": {c: dict(v) for c, v in self.by_city.items()},
+        }
+
+    def _progress(self) -> Event:
+        return ("progress", {
+            "wa_count": self.delivered, "non_wa_count": self.non_wa,
+            "searched": self.searched, "city": self.cidade,
+        })
+
+    def _emit(self, ev: Event) -> None:
+        self._out.put_nowait(ev)
+
+    def _city_of(self, phone: str) -> str:
+        return self._origin.get(e164(phone) or phone, self.cidades[0])
+
+    def _city_progress(self, cidades) -> None:
+        for c in dict.fromkeys(cidades):
+            if c not in self._cities_done:
+                self._emit(("city", {"status": "progress", "name": c, **self.by_city[c]}))
+
+    def _city_done(self, cidade: str) -> None:
+        if cidade not in self._cities_done:
+            self._cities_done.add(cidade)
+            self._emit(("city", {"status": "done", "name": cidade, **self.by_city[cidade]}))
+
+    def _maybe_end(self) -> None:
+        if self.ended:
+            return
+        if self.halted or (not self._producing and self.inflight == 0 and self.probing == 0):
+            self.ended = True
+            if not self.error:
+                for c in self.cidades:
+                    self._city_done(c)
+            self._emit(_END)
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def raise_target(self, n: int) -> bool:
+        """Aumenta n com a busca em andamento (single-flight). False se já não dá para atender n."""
+        if self.ended:
+            return False
+        if n <= self.target:
+            return True
+        if self.halted or not self._producing:
+            return False
+        self.target = n
+        await self._notify()
+        return True
+
+    # ---------- estágio 1: scraping ----------
+    async def _scrape_pass(self, cap: int) -> int:
+        """Uma passada pelos cursores até `cap` telefones novos; devolve quantos pegou."""
+        sources = {
+            c: scrape_numbers(self.nicho, [c], cap, max_pages=None, stats=self.stats, cursor=self.cursors[c])
+            for c in self.cidades if not self.cursors[c].exhausted
+        }
+        if not sources:
+            return 0
+        unread: List[Tuple[str, str]] = []
+        merged = _merge_fair(sources, lambda c, ph: unread.append((c, ph)))
+        taken = 0
+        try:
+            async for cidade, ph in merged:
+                if self.halted:
+                    if ph:
+                        unread.append((cidade, ph))
+                    return taken
+                if ph is None:
+                    if self.cursors[cidade].exhausted:
+                        self._city_done(cidade)
+                    continue
+                if not ph or ph in self.seen:
+                    continue
+                self.seen.add(ph)
+                self._origin[e164(ph) or ph] = cidade
+                self._scraped[e164(ph) or ph] = ph
+                self.searched += 1
+                self.by_city[cidade]["searched"] += 1
+                taken += 1
+
+                if not self.verify:
+                    self._deliver([ph])
+                    self._emit(self._progress())
+                    self._city_progress([cidade])
+                    if self.full or taken >= cap:
+                        return taken
+                    continue
+
+                likelihood = wa_likelihood.score(ph)
+                if likelihood < float(settings.LIKELIHOOD_DEFER_BELOW):
+                    if self._near_target():
+                        self.skipped += 1
+                        self._leftover.append(ph)
+                    else:
+                        self._deferred.append((likelihood, ph))
+                elif not await self._enqueue(likelihood, ph):
+                    unread.append((cidade, ph))
+                    return taken
+                if taken >= cap:
+                    return taken
+            return taken
+        finally:
+            await _uninterrupted(merged.aclose())
+            # já estão no `seen` do cursor: sem isto uma busca retomada nunca os veria
+            for cidade, ph in unread:
+                self.cursors[cidade].pending.insert(0, ph)
+
+    async def _enqueue(self, likelihood: float, ph: str) -> bool:
+        # backpressure: o que já está em voo deve render o suficiente → pausa o scraping
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.halted or not self._enough_in_flight())
+        if self.halted:
+            return False
+        self.inflight += 1
+        await self._candidates.put((-likelihood, next(self._order), ph))
+        return True
+
+    async def _release_deferred(self) -> None:
+        """Scraping secou: agora vale verificar os improváveis, do mais para o menos provável."""
+        self._deferred.sort(reverse=True)
+        while self._deferred:
+            likelihood, ph = self._deferred[0]
+            if not await self._enqueue(likelihood, ph):
+                return  # os que sobraram voltam para o cursor no fim (_return_unused)
+            self._deferred.pop(0)
+
+    async def _produce(self) -> None:
+        try:
+            for c in self.cidades:
+                self._emit(("city", {"status": "start", "name": c}))
+            if self.verify:
+                await wa_likelihood.refresh()
+            cap = _scrape_cap(self.target, self.verify)
+            while await self._scrape_pass(cap) >= cap and not self.verify and not self.halted:
+                # sem verificação a passada para no teto de n; se n subiu no meio (single-flight),
+                # outra passada continua dos mesmos cursores até o novo n
+                cap = _scrape_cap(self.target - self.delivered, False)
+            await self._release_deferred()
+            if self.verify and not self.halted:
+                # 2ª passada: espera a verificação em voo para saber quanto ainda falta;
+                # o cursor continua dos termos/páginas onde a 1ª parou (sem refazer a varredura)
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self.halted or (self.inflight == 0 and self.probing == 0))
+                if not self.halted:
+                    await self._scrape_pass(_scrape_cap(self.target - self.delivered, True))
+                    await self._release_deferred()
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.error = str(e) or e.__class__.__name__
+            self._emit(("progress", {"error": self.error, **self.summary()}))
+        finally:
+            self._producing = False
+        self._maybe_end()
+
+    # ---------- estágio 2: verificação ----------
+    async def _verify_worker(self) -> None:
+        while True:
+            batch = [(await self._candidates.get())[2]]
+            while len(batch) < self._batch and not self._candidates.empty():
+                batch.append(self._candidates.get_nowait()[2])
+            self._unverified.update((e164(p) or p, p) for p in batch)
+            bad: List[str] = []
+            try:
+                # cada lote que volta já vira item, sem esperar o resto do batch
+                async for phone, has_wa in verify_batched_stream(batch):
+                    if has_wa is not None:
+                        self._unverified.pop(phone, None)
+                    if has_wa is True:
+                        self.wa_hits += 1
+                        self._deliver([phone])
+                    elif has_wa is False:
+                        self.non_wa += 1
+                        self.by_city[self._city_of(phone)]["non_wa_count"] += 1
+                        bad.append(phone)
+            except VerificationUnavailable as e:
+                if not self.unavailable:
+                    self.unavailable = True
+                    self._emit(("verify_unavailable", {
+                        "retry_in_sec": round(e.retry_in, 1), "city": self.cidade,
+                    }))
+            except Exception:
+                pass  # não marca como não-WA em caso de erro
+            if bad and wa_probe.enabled() and not self.halted:
+                # segundo passe em paralelo: os 'ok' acima já saíram sem esperar o wa.me
+                self.probing += len(bad)
+                t = asyncio.create_task(self._probe(bad))
+                self._probes.add(t)
+                t.add_done_callback(self._probes.discard)
+            self.inflight -= len(batch)
+            self._emit(self._progress())
+            self._city_progress(self._city_of(p) for p in batch)
+            await self._notify()
+            self._maybe_end()
+
+    def _deliver(self, ok: List[str]) -> None:
+        for p in ok:
+            if self.full:
+                self._leftover.append(p)
+                continue
+            self.delivered += 1
+            cidade = self._city_of(p)
+            self.by_city[cidade]["wa_count"] += 1
+            item = {"phone": p, "city": cidade}
+            if self.verify:
+                item["has_whatsapp"] = True
+            self._emit(("item", item))
+
+    # ---------- estágio 2b: segundo passe wa.me ----------
+    async def _probe(self, bad: List[str]) -> None:
+        try:
+            found = await wa_probe.recover(bad)
+        except Exception:
+            found = []
+        self.non_wa -= len(found)
+        self.wa_hits += len(found)
+        for p in found:
+            self.by_city[self._city_of(p)]["non_wa_count"] -= 1
+        self._deliver(found)
+        self.probing -= len(bad)
+        if found:
+            self._emit(self._progress())
+            self._city_progress(self._city_of(p) for p in found)
+        await self._notify()
+        self._maybe_end()
+
+    def _return_unused(self) -> None:
+        """
+        Encerrando: o que já está no `seen` dos cursores mas não saiu (improváveis adiados ou
+        descartados, fila, lote cortado no meio, sem veredito, WA além de n) volta para o
+        `pending` da cidade de origem, para uma busca com ?cursor= ainda ver esses números.
+        """
+        left = [ph for _, ph in self._deferred]
+        while not self._candidates.empty():
+            left.append(self._candidates.get_nowait()[2])
+        left += self._unverified.values()
+        left += self._leftover
+        self._deferred, self._unverified, self._leftover = [], {}, []
+        for ph in dict.fromkeys(self._scraped.get(e164(p) or p, p) for p in left):
+            pending = self.cursors[self._city_of(ph)].pending
+            if ph not in pending:
+                pending.append(ph)
+
+    # ---------- estágio 3: emissor ----------
+    async def events(self) -> AsyncGenerator[Event, None]:
+        tasks = [asyncio.create_task(self._produce())]
+        if self.verify:
+            workers = max(1, int(settings.PIPELINE_VERIFY_WORKERS))
+            tasks += [asyncio.create_task(self._verify_worker()) for _ in range(workers)]
+        try:
+            while True:
+                ev = await self._out.get()
+                if ev is _END:
+                    return
+                yield ev
+        finally:
+            tasks += list(self._probes)
+            for t in tasks:
+                t.cancel()
+            try:
+                await _uninterrupted(asyncio.gather(*tasks, return_exceptions=True))
+            finally:
+                self._return_unused()
+                scan_cursors.save(self.cursor_id, self.cursors)
+
+    async def collect(self) -> List[str]:
+        """Roda até o fim e devolve só os telefones entregues (endpoint JSON)."""
+        items: List[str] = []
+        async for kind, data in self.events():
+            if kind == "item":
+                items.append(data["phone"])
+        return items
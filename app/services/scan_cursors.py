@@ -0,0 +1,47 @@
+# app/services/scan_cursors.py
+# Cursores de varredura em memória (TTL + LRU). O "done" de uma busca leva o id dos cursores
+# (um por cidade); uma requisição seguinte com ?cursor=<id> para o mesmo nicho/cidades continua
+# as mesmas páginas de onde pararam, sem baixar de novo o que a anterior já viu.
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from .scraper import ScanCursor
+
+Cursors = Dict[str, ScanCursor]  # cidade -> cursor
+
+_store: "OrderedDict[str, Tuple[Cursors, float]]" = OrderedDict()
+_counters = {"saved": 0, "resumed": 0, "misses": 0}
+
+def _matches(cursors: Cursors, nicho: str, cidades: List[str]) -> bool:
+    return sorted(cursors) == sorted(cidades) and all(not cur.started or cur.matches(nicho, [c]) for c, cur in cursors.items())
+
+def save(cursor_id: str, cursors: Cursors) -> None:
+    """Guarda (ou renova) os cursores; varredura esgotada não tem o que continuar."""
+    if not any(cur.started for cur in cursors.values()) or all(cur.exhausted for cur in cursors.values()):
+        _store.pop(cursor_id, None)
+        return
+    _store[cursor_id] = (cursors, time.time())
+    _store.move_to_end(cursor_id)
+    _counters["saved"] += 1
+    while len(_store) > max(1, int(settings.SCAN_CURSOR_MAX)):
+        _store.popitem(last=False)
+
+def take(cursor_id: Optional[str], nicho: str, cidades: List[str]) -> Optional[Cursors]:
+    """Retira os cursores do depósito (uma busca por vez os usa); None se expirou ou é de outra busca."""
+    if not cursor_id:
+        return None
+    item = _store.get(cursor_id)
+    if item is not None and time.time() - item[1] > float(settings.SCAN_CURSOR_TTL_SEC):
+        _store.pop(cursor_id, None)
+        item = None
+    if item is None or not _matches(item[0], nicho, cidades):
+        _counters["misses"] += 1
+        return None
+    _store.pop(cursor_id, None)
+    _counters["resumed"] += 1
+    return item[0]
+
+def stats() -> dict:
+    return {**_counters, "stored": len(_store)}
@@ -0,0 +1,379 @@
+# app/services/scrape_workers.py
+# Pool de processos de scraping: cada worker tem seu próprio loop, Playwright e Chromium.
+# O processo da API despacha jobs de search_numbers por fila e recebe os telefones de volta.
+# Com SCRAPER_WORKERS=0 tudo roda no próprio processo, como antes.
+import asyncio
+from asyncio import CancelledError
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from dataclasses import asdict, fields
+from typing import AsyncGenerator, Dict, Iterable, List, Optional
+
+from ..config import settings
+from .scraper import ScanCursor, ScrapeStats, search_numbers
+
+HEARTBEAT_SEC = 5
+STALE_AFTER_SEC = 45      # sem heartbeat por mais que isso = worker travado
+MONITOR_EVERY_SEC = 2
+CANCEL_ACK_SEC = 5        # espera pelo "done" de um job cancelado (traz o cursor)
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+# ================= lado do worker (processo filho) =================
+def _worker_main(wid: int, job_q, result_q) -> None:
+    asyncio.run(_worker_loop(wid, job_q, result_q))
+
+async def _worker_loop(wid: int, job_q, result_q) -> None:
+    from .scraper import shutdown_playwright
+
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+    tasks: Dict[str, asyncio.Task] = {}
+
+    def reader():
+        while True:
+            msg = job_q.get()
+            loop.call_soon_threadsafe(inbox.put_nowait, msg)
+            if msg[0] == "stop":
+                return
+
+    threading.Thread(target=reader, name=f"scrape-worker-{wid}-inbox", daemon=True).start()
+
+    async def run_job(job_id: str, args: dict) -> None:
+        stats = ScrapeStats()
+        cursor = ScanCursor.from_dict(args["cursor"]) if args.get("cursor") else None
+        error = None
+        try:
+            async for ph in search_numbers(
+                args["nicho"], args["locais"], args["target"],
+                max_pages=args.get("max_pages"),
+                concurrency=args.get("concurrency"),
+                engine=args.get("engine"),
+                stats=stats,
+                cursor=cursor,
+            ):
+                result_q.put(("phone", job_id, ph))
+        except CancelledError:
+            pass
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        finally:
+            tasks.pop(job_id, None)
+            result_q.put(("done", job_id, asdict(stats), error, cursor.to_dict() if cursor else None))
+
+    async def heartbeat():
+        while True:
+            result_q.put(("beat", wid, len(tasks)))
+            await asyncio.sleep(HEARTBEAT_SEC)
+
+    result_q.put(("hello", wid, os.getpid()))
+    beat = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            msg = await inbox.get()
+            kind = msg[0]
+            if kind == "run":
+                _, job_id, args = msg
+                tasks[job_id] = asyncio.create_task(run_job(job_id, args))
+            elif kind == "cancel":
+                t = tasks.get(msg[1])
+                if t: t.cancel()
+            elif kind == "stop":
+                break
+    finally:
+        beat.cancel()
+        for t in list(tasks.values()):
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        await shutdown_playwright()
+
+# ================= lado da API =================
+class _Worker:
+    def __init__(self, wid: int, ctx):
+        self.wid = wid
+        self.ctx = ctx
+        self.proc = None
+        self.job_q = None
+        self.pid: Optional[int] = None
+        self.jobs: set = set()
+        self.last_beat = 0.0
+        self.restarts = 0
+
+    def start(self, result_q) -> None:
+        self.job_q = self.ctx.Queue()
+        self.proc = self.ctx.Process(
+            target=_worker_main, args=(self.wid, self.job_q, result_q),
+            name=f"scrape-worker-{self.wid}", daemon=True,
+        )
+        self.proc.start()
+        self.pid = self.proc.pid
+        self.last_beat = time.monotonic()
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.is_alive()
+
+    def healthy(self) -> bool:
+        return self.alive() and time.monotonic() - self.last_beat < STALE_AFTER_SEC
+
+    def kill(self) -> None:
+        try:
+            if self.proc is not None and self.proc.is_alive():
+                self.proc.terminate()
+                self.proc.join(5)
+                if self.proc.is_alive():
+                    self.proc.kill()
+        except Exception:
+            pass
+
+class _Job:
+    def __init__(self, job_id: str, args: dict):
+        self.id = job_id
+        self.args = args
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.worker: Optional[_Worker] = None
+        self.yielded = 0
+        self.redispatched = False
+
+def _add_stats(stats: ScrapeStats, remote: dict) -> None:
+    """Soma (não substitui): o mesmo ScrapeStats acumula as duas passadas e as várias cidades."""
+    for f in fields(ScrapeStats):
+        value = remote.get(f.name)
+        if isinstance(value, dict):
+            acc = getattr(stats, f.name)
+            for k, v in value.items():
+                acc[k] = acc.get(k, 0) + v
+        elif value:
+            setattr(stats, f.name, getattr(stats, f.name) + value)
+
+class WorkerPool:
+    def __init__(self, size: int):
+        self.size = max(1, int(size))
+        self._ctx = mp.get_context("spawn")
+        self._result_q = None
+        self._workers: List[_Worker] = []
+        self._jobs: Dict[str, _Job] = {}
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._reader: Optional[threading.Thread] = None
+
+    # ---------- ciclo de vida ----------
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._result_q = self._ctx.Queue()
+        self._workers = [_Worker(i, self._ctx) for i in range(self.size)]
+        for w in self._workers:
+            w.start(self._result_q)
+        self._reader = threading.Thread(target=self._read_results, name="scrape-workers-results", daemon=True)
+        self._reader.start()
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._monitor:
+            self._monitor.cancel()
+        for w in self._workers:
+            try:
+                w.job_q.put(("stop",))
+            except Exception:
+                pass
+        await asyncio.to_thread(self._join_all)
+        for job in list(self._jobs.values()):
+            job.queue.put_nowait(("done", {}, "scrape workers stopped", None))
+        self._jobs.clear()
+        if self._result_q is not None:
+            self._result_q.put(None)  # libera a thread leitora
+
+    def _join_all(self) -> None:
+        for w in self._workers:
+            if w.proc is not None:
+                w.proc.join(10)
+            w.kill()
+
+    # ---------- mensagens vindas dos workers ----------
+    def _read_results(self) -> None:
+        while True:
+            try:
+                msg = self._result_q.get()
+            except (EOFError, OSError):
+                return
+            if msg is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_message, msg)
+
+    def _on_message(self, msg) -> None:
+        kind = msg[0]
+        if kind in ("hello", "beat"):
+            w = self._workers[msg[1]]
+            w.last_beat = time.monotonic()
+            if kind == "hello":
+                w.pid = msg[2]
+            return
+        job = self._jobs.get(msg[1])
+        if job is None:
+            return  # job já encerrado/cancelado pelo lado da API
+        if kind == "phone":
+            job.queue.put_nowait(("phone", msg[2]))
+        elif kind == "done":
+            if job.worker is not None:
+                job.worker.jobs.discard(job.id)
+            job.queue.put_nowait(("done", msg[2], msg[3], msg[4]))
+
+    # ---------- saúde / restart ----------
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(MONITOR_EVERY_SEC)
+            for w in self._workers:
+                if w.healthy():
+                    continue
+                orphans = [self._jobs[j] for j in list(w.jobs) if j in self._jobs]
+                w.jobs.clear()
+                await asyncio.to_thread(w.kill)
+                w.restarts += 1
+                w.start(self._result_q)
+                for job in orphans:
+                    self._recover(job)
+
+    def _recover(self, job: _Job) -> None:
+        # nada entregue ainda: dá pra repetir em outro worker sem duplicar telefones
+        if job.yielded == 0 and not job.redispatched:
+            job.redispatched = True
+            self._dispatch(job)
+            return
+        job.queue.put_nowait(("done", {}, "scrape worker crashed", None))
+
+    def _pick(self) -> _Worker:
+        alive = [w for w in self._workers if w.healthy()] or self._workers
+        return min(alive, key=lambda w: len(w.jobs))
+
+    def _dispatch(self, job: _Job) -> None:
+        w = self._pick()
+        job.worker = w
+        w.jobs.add(job.id)
+        w.job_q.put(("run", job.id, job.args))
+
+    def health(self) -> List[dict]:
+        now = time.monotonic()
+        return [{
+            "id": w.wid, "pid": w.pid, "alive": w.alive(), "healthy": w.healthy(),
+            "jobs": len(w.jobs), "restarts": w.restarts,
+            "last_beat_sec": round(now - w.last_beat, 1),
+        } for w in self._workers]
+
+    # ---------- API ----------
+    async def stream(
+        self, args: dict, stats: Optional[ScrapeStats] = None, cursor: Optional[ScanCursor] = None,
+    ) -> AsyncGenerator[str, None]:
+        job = _Job(f"{os.getpid()}-{next(self._ids)}", args)
+        self._jobs[job.id] = job
+        self._dispatch(job)
+        finished = False
+        try:
+            while True:
+                kind, *rest = await job.queue.get()
+                if kind == "phone":
+                    job.yielded += 1
+                    yield rest[0]
+                    continue
+                finished = True
+                error = self._apply_done(rest, stats, cursor)
+                if error:
+                    raise WorkerCrashed(error)
+                return
+        finally:
+            if not finished:
+                await self._cancel(job, stats, cursor)
+            self._jobs.pop(job.id, None)
+
+    @staticmethod
+    def _apply_done(
+        rest: list, stats: Optional[ScrapeStats], cursor: Optional[ScanCursor], unsent: Iterable[str] = (),
+    ) -> Optional[str]:
+        remote_stats, error, remote_cursor = rest
+        if cursor is not None and remote_cursor:
+            cursor.load(remote_cursor)
+            # já saíram da varredura remota mas ninguém consumiu: ficam para quem retomar
+            cursor.pending[:0] = list(unsent)
+        if stats is not None:
+            _add_stats(stats, remote_stats)
+        return error
+
+    async def _cancel(self, job: _Job, stats: Optional[ScrapeStats], cursor: Optional[ScanCursor]) -> None:
+        """Consumidor parou antes: cancela no worker e espera o "done", que traz o cursor atualizado."""
+        w = job.worker
+        if w is None:
+            return
+        try:
+            w.job_q.put(("cancel", job.id))
+        except Exception:
+            w.jobs.discard(job.id)
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + CANCEL_ACK_SEC
+        unsent: List[str] = []
+        try:
+            while True:
+                kind, *rest = await asyncio.wait_for(job.queue.get(), max(0.0, deadline - loop.time()))
+                if kind == "phone":
+                    unsent.append(rest[0])
+                    continue
+                self._apply_done(rest, stats, cursor, unsent)
+                return
+        except asyncio.TimeoutError:
+            pass  # sem resposta: o cursor fica como estava antes deste job
+        finally:
+            w.jobs.discard(job.id)
+
+_pool: Optional[WorkerPool] = None
+
+async def start() -> None:
+    global _pool
+    n = int(settings.SCRAPER_WORKERS)
+    if n > 0 and _pool is None:
+        _pool = WorkerPool(n)
+        await _pool.start()
+
+async def stop() -> None:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.stop()
+
+def health() -> List[dict]:
+    return _pool.health() if _pool is not None else []
+
+async def scrape_numbers(
+    nicho: str,
+    locais: List[str],
+    target: int,
+    *,
+    max_pages: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    stats: Optional[ScrapeStats] = None,
+    engine: Optional[str] = None,
+    cursor: Optional[ScanCursor] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Mesma interface de search_numbers; usa o pool de processos quando SCRAPER_WORKERS > 0.
+    No pool o cursor vai junto do job e volta atualizado no "done" do worker, inclusive
+    quando o consumidor para antes (o cancelamento espera esse "done" por CANCEL_ACK_SEC).
+    """
+    if _pool is None:
+        gen = search_numbers(nicho, locais, target, max_pages=max_pages,
+                             concurrency=concurrency, stats=stats, engine=engine, cursor=cursor)
+        try:
+            async for ph in gen:
+                yield ph
+        finally:
+            await gen.aclose()  # fecha já (e atualiza o cursor), não quando o GC passar
+        return
+    args = {
+        "nicho": nicho, "locais": list(locais), "target": target,
+        "max_pages": max_pages, "concurrency": concurrency, "engine": engine,
+        "cursor": cursor.to_dict() if cursor is not None else None,
+    }
+    async for ph in _pool.stream(args, stats, cursor):
+        yield ph
@@ -2,20 +2,31 @@
 import asyncio
 from asyncio import CancelledError
 import random
+import re
+import time
 import urllib.parse
 import base64
+import uuid
 import unicodedata
-from typing import AsyncGenerator, List, Set, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import AsyncGenerator, List, Set, Optional, Tuple
 
+import httpx
 from playwright.async_api import (
     async_playwright,
     TimeoutError as PWTimeoutError,
     Error as PWError,
 )
 from ..config import settings
-from ..utils.phone import extract_phones_from_text, normalize_br
+from ..utils.phone import phones_from_dom_payload
+from . import serp_cache, serp_http
+from . import variant_stats
+from .governor import governor
 
-SEARCH_FMT = "https://www.google.com/search?tbm=lcl&hl=pt-BR&gl=BR&q={query}&start={start}{uule}"
+GOOGLE_BASE = settings.SCRAPER_GOOGLE_BASE_URL.rstrip("/")  # trocável p/ apontar a um servidor fake em testes
+SEARCH_FMT = GOOGLE_BASE + "/search?tbm=lcl&hl=pt-BR&gl=BR&q={query}&start={start}{uule}"
 
 RESULT_CONTAINERS = [
     ".rlfl__tls", ".VkpGBb", ".rllt__details", ".rllt__wrapped",
@@ -56,15 +67,25 @@ def _clean_query(s: str) -> str:
     s = (s or "").strip()
     return " ".join(s.split())
 
-def _quoted_variants(q: str) -> List[str]:
-    out = [q]
-    if " " in q: out.append(f'"{q}"')
-    if q.endswith("s"): out.append(q[:-1])
-    return list(dict.fromkeys(out))
+# Variações vêm com o "padrão" que as gerou (ex.: "base_quoted", "em_city_uf"):
+# o rendimento é medido por padrão e serve para ordenar buscas futuras.
+def _quoted_variants(kind: str, q: str) -> List[Tuple[str, str]]:
+    out = [(kind, q)]
+    if " " in q: out.append((f"{kind}_quoted", f'"{q}"'))
+    if q.endswith("s"): out.append((f"{kind}_singular", q[:-1]))
+    return out
+
+def _dedup_variants(items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    seen, out = set(), []
+    for pattern, text in items:
+        if text.strip() and text not in seen:
+            seen.add(text)
+            out.append((pattern, text))
+    return out
 
-def _niche_variants(q: str) -> List[str]:
+def _niche_variants(q: str) -> List[Tuple[str, str]]:
     q = _clean_query(q)
-    base = [q]
+    base = [("base", q)]
     synonyms = {
         "restaurantes veganos": ["restaurante vegano", "comida vegana", "vegano"],
         "distribuidores de alimentos": ["distribuidora de alimentos", "atacadista de alimentos", "atacado de alimentos"],
@@ -72,11 +93,15 @@ def _niche_variants(q: str) -> List[str]:
     }
     for k, alts in synonyms.items():
         if k in q.lower():
-            base += alts
-    out: List[str] = []
-    for b in base:
-        out += _quoted_variants(b)
-    return list(dict.fromkeys([_clean_query(x) for x in out if x.strip()]))
+            base += [("syn", a) for a in alts]
+    out: List[Tuple[str, str]] = []
+    for kind, b in base:
+        out += _quoted_variants(kind, b)
+    return _dedup_variants([(p, _clean_query(x)) for p, x in out])
+
+BR_UFS = frozenset((
+    "AC AL AM AP BA CE DF ES GO MA MG MS MT PA PB PE PI PR RJ RN RO RR RS SC SE SP TO"
+).split())
 
 def _city_alias(city: str) -> str:
     c = (city or "").strip()
@@ -85,8 +110,12 @@ def _city_alias(city: str) -> str:
         "bh": "Belo Horizonte, MG",
         "belo horizonte": "Belo Horizonte, MG",
         "sp": "São Paulo, SP",
+        "são paulo": "São Paulo, SP",
+        "sao paulo": "São Paulo, SP",
         "rj": "Rio de Janeiro, RJ",
+        "rio de janeiro": "Rio de Janeiro, RJ",
         "poa": "Porto Alegre, RS",
+        "porto alegre": "Porto Alegre, RS",
         "sampa": "São Paulo, SP",
     }
     return aliases.get(lower, c)
@@ -117,35 +146,61 @@ async def _humanize(page) -> None:
     except Exception:
         pass
 
-async def _extract_phones_from_page(page) -> List[str]:
-    phones: Set[str] = set()
+# Uma única ida ao browser: tel: (href + texto), texto dos containers sem
+# repetir blocos aninhados (#search já contém .VkpGBb etc.) e links de fichas.
+_PAGE_PAYLOAD_JS = """
+({ containers, links, maxLinks }) => {
+  const tel = [], telText = [];
+  for (const a of document.querySelectorAll("a[href^='tel:']")) {
+    tel.push(a.getAttribute('href') || '');
+    telText.push(a.innerText || a.textContent || '');
+  }
+  const picked = new Set();
+  for (const sel of containers) {
+    try { document.querySelectorAll(sel).forEach(el => picked.add(el)); } catch (e) {}
+  }
+  const text = [];
+  for (const el of picked) {
+    let p = el.parentElement, nested = false;
+    while (p) { if (picked.has(p)) { nested = true; break; } p = p.parentElement; }
+    if (!nested) text.push(el.innerText || el.textContent || '');
+  }
+  let hrefs = [];
+  if (maxLinks > 0) {
+    try {
+      hrefs = Array.from(document.querySelectorAll(links))
+        .map(e => e.getAttribute('href')).filter(Boolean).slice(0, maxLinks);
+    } catch (e) {}
+  }
+  return { tel, telText, text, hrefs };
+}
+"""
+
+async def _page_payload(page, *, max_links: int = 0) -> dict:
     try:
-        hrefs = await page.eval_on_selector_all("a[href^='tel:']", "els => els.map(e => e.getAttribute('href'))")
-        for h in hrefs or []:
-            n = normalize_br((h or "").replace("tel:", ""))
-            if n: phones.add(n)
-        texts = await page.eval_on_selector_all("a[href^='tel:']", "els => els.map(e => e.innerText || e.textContent || '')")
-        for t in texts or []:
-            n = normalize_br(t)
-            if n: phones.add(n)
-        for sel in RESULT_CONTAINERS:
-            try:
-                blocks = await page.eval_on_selector_all(sel, "els => els.map(e => e.innerText || e.textContent || '')")
-                for block in blocks or []:
-                    for n in extract_phones_from_text(block):
-                        phones.add(n)
-            except Exception:
-                continue
+        data = await page.evaluate(_PAGE_PAYLOAD_JS, {
+            "containers": RESULT_CONTAINERS,
+            "links": ",".join(LISTING_LINK_SELECTORS),
+            "maxLinks": max_links,
+        })
+        return data or {}
     except Exception:
-        pass
-    return list(phones)
+        return {}
 
-def _city_variants(city: str) -> List[str]:
-    c = _city_alias(city)
-    base = [c, f"{c} MG", f"{c}, MG"]
-    no_acc = list({_norm_ascii(x) for x in base})
-    variants = base + [f"em {x}" for x in base] + no_acc + [f"em {x}" for x in no_acc]
-    return list(dict.fromkeys(variants))
+async def _extract_phones_from_page(page) -> List[str]:
+    return phones_from_dom_payload(await _page_payload(page))
+
+def _city_parts(city: str) -> Tuple[str, str]:
+    """("Belo Horizonte", "MG"): UF digitada ("Cidade, UF") ou do alias; sem nenhuma, SCRAPER_DEFAULT_UF."""
+    name, _, uf = _city_alias(city).partition(",")
+    return name.strip(), (uf.strip() or settings.SCRAPER_DEFAULT_UF).upper()
+
+def _city_variants(city: str) -> List[Tuple[str, str]]:
+    name, uf = _city_parts(city)
+    base = [("city", name), ("city_uf", f"{name} {uf}"), ("city_comma_uf", f"{name}, {uf}")]
+    no_acc = [(f"ascii_{p}", _norm_ascii(x)) for p, x in base]
+    variants = base + [(f"em_{p}", f"em {x}") for p, x in base] + no_acc + [(f"em_{p}", f"em {x}") for p, x in no_acc]
+    return _dedup_variants(variants)
 
 async def _is_captcha_or_sorry(page) -> bool:
     try:
@@ -157,10 +212,6 @@ async def _is_captcha_or_sorry(page) -> bool:
     except Exception:
         return False
 
-def _cooldown_secs(hit: int) -> int:
-    base = 18; mx = 110
-    return min(mx, int(base * (1.6 ** max(0, hit - 1))) + random.randint(0, 9))
-
 # ---------- Playwright: browser único, contexto por request ----------
 _pw = None
 _browser = None
@@ -169,6 +220,10 @@ async def _ensure_browser():
     global _pw, _browser
     if _pw is None:
         _pw = await async_playwright().start()
+    if _browser is not None and not _browser.is_connected():
+        # Chromium caiu: descarta contextos quentes presos ao browser morto
+        _browser = None
+        _warm_pools.clear()
     if _browser is None:
         launch_args = {
             "headless": settings.HEADLESS,
@@ -197,6 +252,199 @@ async def _new_context():
     )
     return context
 
+async def _close_quietly(obj) -> None:
+    try:
+        await obj.close()
+    except (PWError, CancelledError, Exception):
+        pass
+
+# ---------- estatísticas por busca ----------
+@dataclass
+class ScrapeStats:
+    serp_pages: int = 0
+    listings: int = 0
+    listing_cache_hits: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    http_pages: int = 0      # SERPs resolvidas pelo caminho rápido (sem browser)
+    http_fallbacks: int = 0  # caminho rápido não serviu e a página foi para o Playwright
+    blocked_requests: int = 0
+    bytes_saved: int = 0  # estimativa: o recurso bloqueado nunca é baixado, então usamos tamanho típico por tipo
+    blocked_by_type: dict = field(default_factory=dict)
+
+# ---------- interceptação de recursos pesados ----------
+# tamanho típico (bytes) de cada tipo de recurso numa SERP local do Google
+_TYPICAL_BYTES = {
+    "image": 14_000, "media": 120_000, "font": 38_000, "stylesheet": 22_000,
+    "script": 55_000, "xhr": 4_000, "fetch": 4_000, "other": 2_000,
+}
+_STUB_CONTENT_TYPES = {"script": "application/javascript", "stylesheet": "text/css"}
+
+def _csv_setting(value: str) -> List[str]:
+    return [x.strip().lower() for x in (value or "").split(",") if x.strip()]
+
+class _RoutePolicy:
+    """
+    Decide o destino de cada request do contexto:
+      allow-list de URL  -> passa sempre;
+      tipo ou URL bloqueados -> script/css recebem corpo vazio (stub), o resto é abortado.
+    """
+
+    def __init__(self):
+        self.enabled = bool(settings.SCRAPER_BLOCK_RESOURCES)
+        self.block_types = set(_csv_setting(settings.SCRAPER_BLOCK_RESOURCE_TYPES))
+        self.block_urls = _csv_setting(settings.SCRAPER_BLOCK_URL_PATTERNS)
+        self.allow_urls = _csv_setting(settings.SCRAPER_ALLOW_URL_PATTERNS)
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        u = (url or "").lower()
+        if u.startswith(("data:", "about:")):
+            return False
+        if any(p in u for p in self.allow_urls):
+            return False
+        return resource_type in self.block_types or any(p in u for p in self.block_urls)
+
+_route_policy = _RoutePolicy()
+
+# ---------- pool de páginas quentes ----------
+PAGE_TIMEOUT_MS = 20000
+
+class _PagePool:
+    """
+    Páginas reaproveitadas dentro de um contexto (paginação da SERP e fichas).
+
+    - no máximo `size` páginas emprestadas ao mesmo tempo;
+    - ao devolver, a página volta para about:blank; se falhar, é descartada;
+    - página que sofreu 'crash' ou fechou nunca é entregue de novo.
+    """
+
+    def __init__(self, context, size: int):
+        self.context = context
+        self.tainted = False  # viu captcha: não reaproveitar o contexto em outra busca
+        self.stats = ScrapeStats()  # trocado a cada busca que aluga o pool
+        self._sem = asyncio.Semaphore(max(2, int(size)))
+        self._idle: List = []
+        self._crashed: Set = set()
+        self._closed = False
+
+    async def _new_page(self):
+        page = await self.context.new_page()
+        page.set_default_timeout(PAGE_TIMEOUT_MS)
+        page.on("crash", lambda p: self._crashed.add(p))
+        return page
+
+    async def _healthy(self, page) -> bool:
+        if page in self._crashed or page.is_closed():
+            return False
+        try:
+            return await asyncio.wait_for(page.evaluate("() => 1"), timeout=3) == 1
+        except (PWError, asyncio.TimeoutError, Exception):
+            return False
+
+    async def _reset(self, page) -> bool:
+        if page in self._crashed or page.is_closed():
+            return False
+        try:
+            await page.goto("about:blank", timeout=5000)
+            return True
+        except (PWError, Exception):
+            return False
+
+    async def _discard(self, page) -> None:
+        self._crashed.discard(page)
+        await _close_quietly(page)
+
+    async def acquire(self):
+        await self._sem.acquire()
+        try:
+            while self._idle:
+                page = self._idle.pop()
+                if await self._healthy(page):
+                    return page
+                await self._discard(page)
+            return await self._new_page()
+        except BaseException:
+            self._sem.release()
+            raise
+
+    async def release(self, page, *, broken: bool = False) -> None:
+        try:
+            if broken or self._closed or not await self._reset(page):
+                await self._discard(page)
+            else:
+                self._idle.append(page)
+        finally:
+            self._sem.release()
+
+    @asynccontextmanager
+    async def page(self):
+        page = await self.acquire()
+        broken = False
+        try:
+            yield page
+        except (CancelledError, GeneratorExit):
+            broken = True  # cancelado no meio: não gasta tempo resetando
+            raise
+        finally:
+            await self.release(page, broken=broken)
+
+    async def _route(self, route) -> None:
+        req = route.request
+        rtype = req.resource_type
+        try:
+            if not _route_policy.blocks(rtype, req.url):
+                await route.continue_()
+                return
+            st = self.stats
+            st.blocked_requests += 1
+            st.bytes_saved += _TYPICAL_BYTES.get(rtype, _TYPICAL_BYTES["other"])
+            st.blocked_by_type[rtype] = st.blocked_by_type.get(rtype, 0) + 1
+            if rtype in _STUB_CONTENT_TYPES:
+                await route.fulfill(status=200, body="", content_type=_STUB_CONTENT_TYPES[rtype])
+            else:
+                await route.abort("blockedbyclient")
+        except (PWError, Exception):
+            pass  # página/contexto fechado no meio do request
+
+    def reusable(self) -> bool:
+        if self._closed or self.tainted:
+            return False
+        browser = self.context.browser
+        return browser is not None and browser.is_connected()
+
+    async def close(self) -> None:
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for page in idle:
+            await self._discard(page)
+        await _close_quietly(self.context)
+
+# ---------- contextos quentes (opcional) ----------
+_warm_pools: List[_PagePool] = []
+
+async def _lease_pool(size: Optional[int] = None) -> _PagePool:
+    await _ensure_browser()
+    while _warm_pools:
+        pool = _warm_pools.pop()
+        if pool.reusable():
+            return pool
+        await pool.close()
+    context = await _new_context()
+    pool = _PagePool(context, size or settings.SCRAPER_PAGE_POOL_SIZE)
+    if _route_policy.enabled:
+        await context.route("**/*", pool._route)
+    return pool
+
+async def _return_pool(pool: _PagePool) -> None:
+    if pool.reusable() and len(_warm_pools) < max(0, int(settings.SCRAPER_WARM_CONTEXTS)):
+        _warm_pools.append(pool)
+        return
+    await pool.close()
+
+# ---------- concorrência global no browser ----------
+# limita quantas páginas carregam/extraem ao mesmo tempo somando TODAS as buscas
+_browser_slots = asyncio.Semaphore(max(1, int(settings.SCRAPER_BROWSER_CONCURRENCY)))
+
 # ---------- navegação blindada ----------
 async def _safe_goto(page, url: str, **kw):
     try:
@@ -209,168 +457,505 @@ async def _safe_goto(page, url: str, **kw):
         raise
 
 # ---------- abrir ficha ----------
-async def _open_and_extract_from_listing(context, href: str, seen: Set[str]) -> List[str]:
+async def _open_and_extract_from_listing(pages: _PagePool, href: str) -> Optional[List[str]]:
+    """Telefones de uma ficha; None se a navegação falhou (não deve ir para o memo)."""
+    if not href: return []
+    if href.startswith("/"): href = GOOGLE_BASE + href
+
+    try:
+        # mesma ordem da SERP (vaga no browser -> página) para não travar em espera cruzada
+        async with _browser_slots, pages.page() as page2:
+            await _safe_goto(page2, href, wait_until="domcontentloaded", timeout=30000)
+            for sel in ["button:has-text('Telefone')", "button:has-text('Ligar')", "a[aria-label^='Ligar']", "[aria-label*='Telefone']"]:
+                try:
+                    loc = page2.locator(sel)
+                    if await loc.count() > 0 and await loc.first.is_visible():
+                        await loc.first.click()
+                        await page2.wait_for_timeout(350)
+                except Exception:
+                    pass
+            await page2.wait_for_timeout(1000)
+            return await _extract_phones_from_page(page2)
+    except (PWError, Exception):
+        return None
+
+# ---------- memo de fichas (por ludocid/lrd) ----------
+_LISTING_FID_RE = re.compile(r"0x[0-9a-f]+:0x[0-9a-f]+", re.I)
+_LISTING_VOLATILE = {"ved", "ei", "sa", "usg", "sxsrf", "rlst", "biw", "bih", "uact", "oq", "gs_lcp", "sclient"}
+
+def _listing_key(href: str) -> str:
+    """Identidade do estabelecimento: ludocid > lrd > feature id do Maps > URL sem parâmetros voláteis."""
+    parsed = urllib.parse.urlsplit(href or "")
+    qs = urllib.parse.parse_qs(parsed.query)
+    if qs.get("ludocid"):
+        return "cid:" + qs["ludocid"][0]
+    if qs.get("lrd"):
+        return "lrd:" + qs["lrd"][0].split(",")[0]
+    m = _LISTING_FID_RE.search(href or "")
+    if m:
+        return "fid:" + m.group(0).lower()
+    keep = sorted((k, v) for k, vs in qs.items() if k not in _LISTING_VOLATILE for v in vs)
+    return "url:" + parsed.path + "?" + urllib.parse.urlencode(keep)
+
+_listing_memo: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+_listing_inflight: dict = {}
+
+def _listing_memo_get(key: str) -> Optional[List[str]]:
+    item = _listing_memo.get(key)
+    if item is None:
+        return None
+    ts, phones = item
+    if time.monotonic() - ts > settings.LISTING_CACHE_TTL_SEC:
+        _listing_memo.pop(key, None)
+        return None
+    _listing_memo.move_to_end(key)
+    return phones
+
+def _listing_memo_put(key: str, phones: List[str]) -> None:
+    _listing_memo[key] = (time.monotonic(), list(phones))
+    _listing_memo.move_to_end(key)
+    while len(_listing_memo) > max(1, int(settings.LISTING_CACHE_MAX)):
+        _listing_memo.popitem(last=False)
+
+async def _listing_phones(pages: _PagePool, href: str) -> List[str]:
+    """Abre a ficha no máximo uma vez: memo por identidade + coalescência de quem chega durante a abertura."""
+    key = _listing_key(href)
+    hit = _listing_memo_get(key)
+    if hit is not None:
+        pages.stats.listing_cache_hits += 1
+        return hit
+    fut = _listing_inflight.get(key)
+    if fut is not None:
+        return list(await asyncio.shield(fut) or [])
+
+    fut = asyncio.get_running_loop().create_future()
+    _listing_inflight[key] = fut
+    phones: Optional[List[str]] = None
+    try:
+        pages.stats.listings += 1
+        await governor.wait_unblocked()
+        phones = await _open_and_extract_from_listing(pages, href)
+        if phones is not None:
+            _listing_memo_put(key, phones)
+        return phones or []
+    finally:
+        _listing_inflight.pop(key, None)
+        if not fut.done():
+            fut.set_result(phones)
+
+async def _extract_from_listings(pages: _PagePool, hrefs: List[str], sem: asyncio.Semaphore, *, limit: int = 20) -> List[str]:
+    """Abre as fichas em paralelo (limitado por `sem`) e para ao juntar `limit` telefones."""
+    unique = list({_listing_key(h): h for h in hrefs if h}.values())
     out: List[str] = []
-    if not href: return out
-    if href.startswith("/"): href = "https://www.google.com" + href
 
-    page2 = await context.new_page()
+    async def one(href: str) -> List[str]:
+        async with sem:
+            return await _listing_phones(pages, href)
+
+    tasks = [asyncio.create_task(one(h)) for h in unique]
     try:
-        await _safe_goto(page2, href, wait_until="domcontentloaded", timeout=30000)
-        for sel in ["button:has-text('Telefone')", "button:has-text('Ligar')", "a[aria-label^='Ligar']", "[aria-label*='Telefone']"]:
-            try:
-                loc = page2.locator(sel)
-                if await loc.count() > 0 and await loc.first.is_visible():
-                    await loc.first.click()
-                    await page2.wait_for_timeout(350)
-            except Exception:
-                pass
-        await page2.wait_for_timeout(1000)
-        phones = await _extract_phones_from_page(page2)
-        for ph in phones:
-            if ph not in seen:
-                seen.add(ph)
-                out.append(ph)
-    except (PWError, CancelledError, Exception):
-        pass
+        for fut in asyncio.as_completed(tasks):
+            out.extend(await fut)
+            if len(out) >= limit: break
     finally:
-        try: await page2.close()
-        except (PWError, CancelledError, Exception): pass
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
     return out
 
+# ---------- uma página da SERP ----------
+class SerpNotLoaded(Exception):
+    """A SERP abriu mas não deu para ler os resultados (timeout/erro no evaluate)."""
+
+async def _load_serp(pages: _PagePool, url: str):
+    """Navega numa página do pool; em erro do Playwright tenta mais uma vez com página nova."""
+    for attempt in range(2):
+        page = await pages.acquire()
+        try:
+            await _safe_goto(page, url, wait_until="domcontentloaded", timeout=30000)
+            return page
+        except PWError:
+            await pages.release(page, broken=True)
+            if attempt:
+                raise
+        except BaseException:
+            await pages.release(page, broken=True)
+            raise
+
+async def _scrape_serp(pages: _PagePool, url: str) -> Tuple[List[str], List[str], bool]:
+    """Retorna (telefones, links de fichas, captcha?) de uma URL de resultados."""
+    async with _browser_slots:
+        page = await _load_serp(pages, url)
+        broken = False
+        try:
+            await _try_accept_consent(page)
+            await _humanize(page)
+
+            if await _is_captcha_or_sorry(page):
+                return await _extract_phones_from_page(page), [], True
+
+            loaded = True
+            try:
+                await page.wait_for_selector("a[href^='tel:']," + ",".join(RESULT_CONTAINERS), timeout=8000)
+            except PWTimeoutError:
+                loaded = False
+
+            data = await _page_payload(page, max_links=12)
+            phones = phones_from_dom_payload(data)
+            hrefs = [] if phones else [h for h in data.get("hrefs") or [] if h]
+            if not data or not (loaded or phones or hrefs):
+                # extração falhou ou os resultados não carregaram: não é página vazia (nem vai para o cache)
+                raise SerpNotLoaded(url)
+            return phones, hrefs, False
+        except (CancelledError, GeneratorExit):
+            broken = True
+            raise
+        finally:
+            await pages.release(page, broken=broken)
+
+# ---------- motores: Playwright ou HTTP (com fallback) ----------
+class _BrowserEngine:
+    """SERP via Playwright; o contexto só é alugado quando a primeira página precisa dele."""
+    name = "browser"
+
+    def __init__(self, pool_size: int, stats: ScrapeStats):
+        self.stats = stats
+        self._size = pool_size
+        self._pages: Optional[_PagePool] = None
+        self._lock = asyncio.Lock()
+
+    async def pages(self) -> _PagePool:
+        async with self._lock:
+            if self._pages is None:
+                self._pages = await _lease_pool(self._size)
+                self._pages.stats = self.stats
+            return self._pages
+
+    async def fetch(self, url: str) -> Tuple[List[str], List[str], bool]:
+        pages = await self.pages()
+        self.stats.serp_pages += 1
+        phones, hrefs, captcha = await _scrape_serp(pages, url)
+        if captcha:
+            pages.tainted = True
+        return phones, hrefs, captcha
+
+    async def open_listings(self, hrefs: List[str], sem: asyncio.Semaphore) -> List[str]:
+        return await _extract_from_listings(await self.pages(), hrefs, sem)
+
+    async def close(self) -> None:
+        if self._pages is not None:
+            pages, self._pages = self._pages, None
+            await _return_pool(pages)
+
+class _HttpEngine:
+    """Caminho rápido por httpx; cai para o browser em consent/captcha ou quando a SERP não traz telefone."""
+    name = "http"
+
+    def __init__(self, fallback: _BrowserEngine):
+        self.fallback = fallback
+        self.stats = fallback.stats
+
+    async def fetch(self, url: str) -> Tuple[List[str], List[str], bool]:
+        try:
+            parsed = await serp_http.fetch_serp(url)
+        except httpx.HTTPError:
+            parsed = None
+        if parsed is not None and not parsed.blocked and parsed.phones:
+            self.stats.http_pages += 1
+            return parsed.phones, [], False
+        self.stats.http_fallbacks += 1
+        return await self.fallback.fetch(url)
+
+    async def open_listings(self, hrefs: List[str], sem: asyncio.Semaphore) -> List[str]:
+        return await self.fallback.open_listings(hrefs, sem)
+
+    async def close(self) -> None:
+        await self.fallback.close()
+
+def _make_engine(name: Optional[str], pool_size: int, stats: ScrapeStats):
+    browser = _BrowserEngine(pool_size, stats)
+    if (name or settings.SCRAPER_ENGINE or "").strip().lower() == "http":
+        return _HttpEngine(browser)
+    return browser
+
 # ---------- busca principal ----------
+@dataclass
+class _TermState:
+    term: str
+    uule: str
+    pattern: str = ""      # padrão de variação (nicho+cidade) para as estatísticas de rendimento
+    empty_limit: int = 14  # páginas vazias seguidas até desistir do termo
+    idx: int = 0           # próxima página (start = idx * 20) a despachar
+    empty_pages: int = 0
+    captcha_hits: int = 0
+    inflight: int = 0
+    done: bool = False
+    retry: List[int] = field(default_factory=list)  # páginas despachadas que não terminaram (cancelamento)
+
+@dataclass
+class ScanCursor:
+    """
+    Onde uma varredura parou: estado de cada termo (próxima página, páginas vazias,
+    captcha), telefones já vistos e os que foram achados mas não chegaram ao consumidor.
+    Passado de novo a `search_numbers`, continua dali em vez de refazer as mesmas páginas.
+    """
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    query: str = ""
+    locais: List[str] = field(default_factory=list)
+    states: List[_TermState] = field(default_factory=list)
+    seen: Set[str] = field(default_factory=set)
+    pending: List[str] = field(default_factory=list)
+
+    def matches(self, nicho: str, locais: List[str]) -> bool:
+        return self.query == _clean_query(nicho) and self.locais == _cursor_locais(locais)
+
+    @property
+    def started(self) -> bool:
+        return bool(self.states)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.started and not self.pending and all(st.done and not st.retry for st in self.states)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "query": self.query, "locais": list(self.locais),
+            "states": [asdict(st) for st in self.states],
+            "seen": list(self.seen), "pending": list(self.pending),
+        }
+
+    def load(self, data: dict) -> None:
+        self.query = data.get("query", "")
+        self.locais = list(data.get("locais") or [])
+        self.states = [_TermState(**st) for st in data.get("states") or []]
+        self.seen = set(data.get("seen") or [])
+        self.pending = list(data.get("pending") or [])
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ScanCursor":
+        cur = cls(id=data.get("id") or uuid.uuid4().hex)
+        cur.load(data)
+        return cur
+
+def _cursor_locais(locais: List[str]) -> List[str]:
+    return [c for c in ((local or "").strip() for local in locais) if c]
+
+_DONE = object()
+
+async def _build_states(q_base: str, locais: List[str], empty_limit: int) -> List[_TermState]:
+    """Termos por cidade, do padrão que historicamente mais rende ao que menos rende."""
+    history = await variant_stats.snapshot()
+    low_yield_limit = min(empty_limit, int(settings.VARIANT_LOW_YIELD_EMPTY_PAGES))
+    states: List[_TermState] = []
+    for city in _cursor_locais(locais):
+        uule = _uule_for_city(city)
+        terms: dict = {}
+        for cpat, v in _city_variants(city):
+            for npat, qv in _niche_variants(q_base):
+                t = f"{qv} {v}".strip()
+                if t and t not in terms:
+                    terms[t] = f"{npat}+{cpat}"
+        city_states = [
+            _TermState(
+                term=t, uule=uule, pattern=pat,
+                empty_limit=low_yield_limit if variant_stats.is_low_yield(history, pat) else empty_limit,
+            )
+            for t, pat in terms.items()
+        ]
+        city_states.sort(key=lambda st: -variant_stats.score(history, st.pattern))
+        states += city_states
+    return states
+
 async def search_numbers(
     nicho: str,
     locais: List[str],
     target: int,
     *,
     max_pages: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    stats: Optional[ScrapeStats] = None,
+    engine: Optional[str] = None,
+    cursor: Optional[ScanCursor] = None,
 ) -> AsyncGenerator[str, None]:
-    seen: Set[str] = set()
+    """
+    Varre termos (variações de nicho x cidade) e páginas em paralelo com um pool
+    limitado de workers. Cada worker pega a próxima página do primeiro termo
+    ainda ativo (no máx. SCRAPER_PAGES_PER_TERM em voo por termo); os telefones
+    novos passam pelo `seen` compartilhado e saem, em ordem de chegada, por este
+    gerador até bater `target`. Se `stats` vier, acumula contadores da busca nele.
+    `engine` ("browser" | "http") sobrepõe SCRAPER_ENGINE.
+    Com `cursor`, retoma de onde a varredura anterior com o mesmo cursor parou
+    (e o deixa atualizado ao sair, inclusive quando o consumidor para antes).
+    """
+    cursor = cursor if cursor is not None else ScanCursor()
+    seen = cursor.seen
+    stats = stats if stats is not None else ScrapeStats()
     q_base = _clean_query(nicho)
     empty_limit = int(getattr(settings, "MAX_EMPTY_PAGES", 14))
-    captcha_hits_global = 0
+    conc = max(1, int(concurrency or settings.SCRAPER_CONCURRENCY))
+    listing_conc = max(1, int(settings.SCRAPER_LISTING_CONCURRENCY))
+    listing_sem = asyncio.Semaphore(listing_conc)  # fichas abertas ao mesmo tempo nesta busca
+    per_term = max(1, int(settings.SCRAPER_PAGES_PER_TERM))
+    backlog = max(20, conc * 20)  # telefones aguardando o consumidor antes de pausar os workers
+
+    if cursor.started and cursor.matches(nicho, locais):
+        states = cursor.states
+        for st in states:
+            st.inflight = 0
+    else:
+        states = cursor.states = await _build_states(q_base, locais, empty_limit)
+        cursor.query, cursor.locais = q_base, _cursor_locais(locais)
+        seen.clear()
+        cursor.pending.clear()
+
+    # achados na varredura anterior que não chegaram a sair
+    total_yield = 0
+    while cursor.pending:
+        if target and total_yield >= target:
+            return
+        total_yield += 1
+        yield cursor.pending.pop(0)
+    if not states:
+        return
+
+    out: asyncio.Queue = asyncio.Queue()
+    cond = asyncio.Condition()
+    found = total_yield
+    alive = conc
+
+    def dispatchable() -> List[_TermState]:
+        return [st for st in states if st.retry or (not st.done and (max_pages is None or st.idx < max_pages))]
+
+    async def next_job() -> Optional[Tuple[_TermState, int]]:
+        async with cond:
+            while True:
+                if target and found >= target:
+                    return None
+                ready = dispatchable()
+                if not ready and not any(st.inflight for st in states):
+                    return None
+                if out.qsize() < backlog:
+                    for st in ready:
+                        if st.inflight < per_term:
+                            st.inflight += 1
+                            if st.retry:
+                                return st, st.retry.pop(0)
+                            st.idx += 1
+                            return st, st.idx - 1
+                await cond.wait()
+
+    async def fetch_page(st: _TermState, idx: int) -> bool:
+        """Processa a página; True se ela veio da rede (pede pausa antes da próxima)."""
+        nonlocal found
+        if st.done:
+            return False
+        start = idx * 20
+
+        cached = await serp_cache.get(st.term, st.uule, start)
+        if cached is not None:
+            stats.cache_hits += 1
+            phones, _links = cached
+        else:
+            stats.cache_misses += 1
+            q = st.term
+            if st.captcha_hits > 0:
+                decorations = ["", " ", "  ", " ★", " ✔", " ✓"]
+                q = (st.term + random.choice(decorations)).strip()
+            url = SEARCH_FMT.format(query=urllib.parse.quote_plus(q), start=start, uule=st.uule)
+
+            await governor.acquire()  # ritmo e pausa de bloqueio valem para o processo todo
+            phones, hrefs, captcha = await fetcher.fetch(url)
+            if captcha:
+                governor.report_block()
+                st.captcha_hits += 1
+                if st.captcha_hits >= 2:
+                    return False
+            else:
+                governor.report_ok()
+
+            if hrefs:
+                phones.extend(await fetcher.open_listings(hrefs, listing_sem))
+
+            if not captcha:
+                await serp_cache.put(st.term, st.uule, start, list(dict.fromkeys(phones)), hrefs)
+
+        new = 0
+        for ph in phones:
+            if ph not in seen:
+                seen.add(ph)
+                new += 1
+                found += 1
+                out.put_nowait(ph)
 
-    context = await _new_context()
+        variant_stats.record(st.pattern, new)
+        st.empty_pages = st.empty_pages + 1 if new == 0 else 0
+        if st.empty_pages >= st.empty_limit:
+            st.done = True
 
-    try:
-        total_yield = 0
-        for local in locais:
-            city = (local or "").strip()
-            if not city: continue
-            uule = _uule_for_city(city)
-
-            terms: List[str] = []
-            for v in _city_variants(city):
-                for qv in _niche_variants(q_base):
-                    t = f"{qv} {v}".strip()
-                    if t and t not in terms:
-                        terms.append(t)
-
-            for term in terms:
-                empty_pages = 0
-                idx = 0
-                captcha_hits_term = 0
-
-                while True:
-                    if target and total_yield >= target: return
-                    if max_pages is not None and idx >= max_pages: break
-
-                    start = idx * 20
-                    q = term
-                    if captcha_hits_term > 0:
-                        decorations = ["", " ", "  ", " ★", " ✔", " ✓"]
-                        q = (term + random.choice(decorations)).strip()
-
-                    url = SEARCH_FMT.format(query=urllib.parse.quote_plus(q), start=start, uule=uule)
-
-                    # 👉 página EFÊMERA por URL
-                    page = await context.new_page()
-                    page.set_default_timeout(20000)
-
-                    try:
-                        try:
-                            await _safe_goto(page, url, wait_until="domcontentloaded", timeout=30000)
-                        except (PWError, CancelledError):
-                            try: await page.close()
-                            except Exception: pass
-                            page = await context.new_page()
-                            page.set_default_timeout(20000)
-                            await _safe_goto(page, url, wait_until="domcontentloaded", timeout=30000)
-
-                        await _try_accept_consent(page)
-                        await _humanize(page)
-
-                        if await _is_captcha_or_sorry(page):
-                            captcha_hits_term += 1
-                            captcha_hits_global += 1
-                            await page.wait_for_timeout(_cooldown_secs(captcha_hits_global) * 1000)
-                            if captcha_hits_term >= 2:
-                                idx += 1
-                                continue
-
-                        try:
-                            await page.wait_for_selector("a[href^='tel:']," + ",".join(RESULT_CONTAINERS), timeout=8000)
-                        except PWTimeoutError:
-                            pass
-
-                        phones = await _extract_phones_from_page(page)
-
-                        if not phones:
-                            try:
-                                cards = page.locator(",".join(LISTING_LINK_SELECTORS))
-                                count = await cards.count()
-                                to_open = min(count, 12)
-                                for i in range(to_open):
-                                    try:
-                                        href = await cards.nth(i).get_attribute("href")
-                                    except (PWError, Exception):
-                                        href = None
-                                    extracted = await _open_and_extract_from_listing(context, href, seen)
-                                    phones.extend(extracted)
-                                    if len(phones) >= 20: break
-                            except (PWError, Exception):
-                                pass
-
-                        new = 0
-                        for ph in phones:
-                            if ph not in seen:
-                                seen.add(ph)
-                                new += 1
-                                total_yield += 1
-                                yield ph
-                                if target and total_yield >= target:
-                                    try: await page.close()
-                                    except Exception: pass
-                                    return
-
-                        empty_pages = empty_pages + 1 if new == 0 else 0
-                        if empty_pages >= empty_limit:
-                            try: await page.close()
-                            except Exception: pass
-                            break
+        return cached is None
 
+    async def worker() -> None:
+        nonlocal alive
+        try:
+            while True:
+                job = await next_job()
+                if job is None:
+                    return
+                st, idx = job
+                processed = False
+                try:
+                    paced = await fetch_page(st, idx)
+                    processed = True
+                    if paced:
                         wait_ms = random.randint(320, 620) + min(1800, int(idx * 48 + random.randint(140, 300)))
-                        await page.wait_for_timeout(wait_ms)
-                        idx += 1
-
-                    except (PWError, CancelledError, Exception):
-                        try: await page.close()
-                        except Exception: pass
-                        idx += 1
-                        continue
-                    finally:
-                        try:
-                            if not page.is_closed():
-                                await page.close()
-                        except Exception:
-                            pass
+                        await asyncio.sleep(wait_ms / 1000)
+                except CancelledError:
+                    if not processed:
+                        st.retry.append(idx)  # consumidor parou no meio: a página fica para quem retomar
+                    raise
+                except (PWError, Exception):
+                    # página perdida conta como vazia: browser quebrado não prende o termo para sempre
+                    st.empty_pages += 1
+                    if st.empty_pages >= st.empty_limit:
+                        st.done = True
+                finally:
+                    st.inflight -= 1
+                    async with cond:
+                        cond.notify_all()
+        finally:
+            alive -= 1
+            if alive == 0:
+                out.put_nowait(_DONE)
+
+    fetcher = _make_engine(engine, max(int(settings.SCRAPER_PAGE_POOL_SIZE), conc + listing_conc), stats)
+    workers = [asyncio.create_task(worker()) for _ in range(conc)]
+
+    try:
+        while True:
+            ph = await out.get()
+            if ph is _DONE:
+                return
+            async with cond:
+                cond.notify_all()
+            total_yield += 1
+            yield ph
+            if target and total_yield >= target:
+                return
     finally:
-        try: await context.close()
-        except (PWError, CancelledError, Exception): pass
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        while not out.empty():
+            ph = out.get_nowait()
+            if ph is not _DONE:
+                cursor.pending.append(ph)
+        await fetcher.close()
+        await variant_stats.flush()
 
 async def shutdown_playwright():
     global _pw, _browser
+    while _warm_pools:
+        await _warm_pools.pop().close()
     try:
         if _browser:
             await _browser.close()
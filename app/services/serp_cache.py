@@ -0,0 +1,116 @@
+# app/services/serp_cache.py
+# Cache persistente de páginas da SERP: (termo, uule, start) -> telefones + links de fichas.
+# Páginas sem nada expiram em SERP_CACHE_EMPTY_TTL_SEC (bem menor que o TTL normal).
+# Usa o mesmo engine SQLAlchemy do auth (SQLite local / Postgres via AUTH_DB_URL);
+# as chamadas ao banco são síncronas e rodam em thread para não travar o loop.
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, select, delete, func
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..auth import Base, SessionLocal, engine
+from ..config import settings
+
+class SerpPageCache(Base):
+    __tablename__ = "serp_cache"
+    id = Column(Integer, primary_key=True)
+    key = Column(String(64), unique=True, index=True, nullable=False)
+    term = Column(String(512), nullable=False)
+    uule = Column(String(512), nullable=False, default="")
+    start = Column(Integer, nullable=False)
+    phones = Column(Text, nullable=False, default="[]")
+    links = Column(Text, nullable=False, default="[]")
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+Base.metadata.create_all(engine)
+
+_hits = 0
+_misses = 0
+_puts = 0
+EVICT_EVERY = 50  # a cada N gravações limpa expirados e corta o excesso
+
+def _key(term: str, uule: str, start: int) -> str:
+    raw = f"{term}\x1f{uule}\x1f{int(start)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=max(0, int(settings.SERP_CACHE_TTL_SEC)))
+
+def _empty_ttl() -> timedelta:
+    return timedelta(seconds=max(0, min(int(settings.SERP_CACHE_EMPTY_TTL_SEC), int(settings.SERP_CACHE_TTL_SEC))))
+
+def _get_sync(key: str) -> Optional[Tuple[List[str], List[str]]]:
+    with SessionLocal() as s:
+        row = s.scalar(select(SerpPageCache).where(SerpPageCache.key == key))
+        if not row:
+            return None
+        phones, links = json.loads(row.phones or "[]"), json.loads(row.links or "[]")
+        # página vazia vale pouco tempo: pode ter sido um resultado que demorou a carregar
+        if row.created_at < datetime.utcnow() - (_ttl() if phones or links else _empty_ttl()):
+            return None
+        return phones, links
+
+def _put_sync(key: str, term: str, uule: str, start: int, phones: List[str], links: List[str]) -> None:
+    with SessionLocal() as s:
+        row = s.scalar(select(SerpPageCache).where(SerpPageCache.key == key))
+        if row is None:
+            row = SerpPageCache(key=key, term=term[:512], uule=uule[:512], start=int(start))
+            s.add(row)
+        row.phones = json.dumps(list(phones))
+        row.links = json.dumps(list(links))
+        row.created_at = datetime.utcnow()
+        try:
+            s.commit()
+        except SQLAlchemyError:
+            s.rollback()  # outra busca gravou a mesma chave ao mesmo tempo
+
+def _evict_sync() -> None:
+    with SessionLocal() as s:
+        s.execute(delete(SerpPageCache).where(SerpPageCache.created_at < datetime.utcnow() - _ttl()))
+        total = s.scalar(select(func.count()).select_from(SerpPageCache)) or 0
+        excess = total - max(1, int(settings.SERP_CACHE_MAX_ENTRIES))
+        if excess > 0:
+            oldest = select(SerpPageCache.id).order_by(SerpPageCache.created_at).limit(excess)
+            s.execute(delete(SerpPageCache).where(SerpPageCache.id.in_(oldest.scalar_subquery())))
+        s.commit()
+
+async def get(term: str, uule: str, start: int) -> Optional[Tuple[List[str], List[str]]]:
+    """(telefones, links) se a página está no cache e dentro do TTL; senão None."""
+    global _hits, _misses
+    if not settings.SERP_CACHE_ENABLED:
+        return None
+    try:
+        hit = await asyncio.to_thread(_get_sync, _key(term, uule, start))
+    except (SQLAlchemyError, ValueError):
+        hit = None
+    if hit is None:
+        _misses += 1
+    else:
+        _hits += 1
+    return hit
+
+async def put(term: str, uule: str, start: int, phones: List[str], links: List[str]) -> None:
+    global _puts
+    if not settings.SERP_CACHE_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(_put_sync, _key(term, uule, start), term, uule, start, phones, links)
+        _puts += 1
+        if _puts % EVICT_EVERY == 0:
+            await asyncio.to_thread(_evict_sync)
+    except SQLAlchemyError:
+        pass  # cache é best-effort: falha de banco não derruba a busca
+
+def stats() -> dict:
+    total = _hits + _misses
+    return {
+        "enabled": bool(settings.SERP_CACHE_ENABLED),
+        "hits": _hits,
+        "misses": _misses,
+        "hit_rate": round(_hits / total, 4) if total else 0.0,
+        "writes": _puts,
+    }
@@ -0,0 +1,162 @@
+# app/services/serp_http.py
+# Caminho rápido sem browser: baixa a SERP local (tbm=lcl) por HTTP e parseia o HTML em Python.
+# Quem decide cair para o Playwright é o scraper (consent/captcha ou nada encontrado).
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import List, Optional
+import urllib.parse
+
+import httpx
+
+from ..config import settings
+from ..utils.phone import phones_from_dom_payload
+
+# HTTP/2 auto: se 'h2' não estiver instalado, seguimos em HTTP/1.1
+try:
+    import h2.config  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except Exception:
+    _HTTP2_AVAILABLE = False
+
+BLOCK_TAGS = {
+    "div", "p", "li", "ul", "ol", "br", "td", "tr", "table", "section", "article",
+    "header", "footer", "h1", "h2", "h3", "h4", "h5", "h6",
+}
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg"}
+BLOCKED_SIGNALS = ("/sorry/", "unusual traffic", "recaptcha", "g-recaptcha", 'action="https://consent.google')
+
+def _is_listing_href(href: str) -> bool:
+    h = href or ""
+    return (
+        "/local/place" in h
+        or "/maps/place" in h
+        or "ludocid=" in h
+        or ("/search?" in h and "lrd=" in h)
+    )
+
+class _SerpHTMLParser(HTMLParser):
+    """Monta o mesmo payload do script da página: {tel, telText, text, hrefs}."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tel: List[str] = []
+        self.tel_text: List[str] = []
+        self.hrefs: List[str] = []
+        self.blocks: List[str] = []
+        self._cur: List[str] = []
+        self._skip = 0
+        self._tel_buf: Optional[List[str]] = None
+
+    def _flush_block(self) -> None:
+        txt = "".join(self._cur).strip()
+        if txt:
+            self.blocks.append(txt)
+        self._cur = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush_block()
+        if tag == "a":
+            href = dict(attrs).get("href") or ""
+            if href.startswith("tel:"):
+                self.tel.append(href)
+                self._tel_buf = []
+            elif _is_listing_href(href):
+                self.hrefs.append(href)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+            return
+        if tag == "a" and self._tel_buf is not None:
+            self.tel_text.append("".join(self._tel_buf))
+            self._tel_buf = None
+        if tag in BLOCK_TAGS:
+            self._flush_block()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self._cur.append(data)
+        if self._tel_buf is not None:
+            self._tel_buf.append(data)
+
+    def payload(self) -> dict:
+        self._flush_block()
+        return {"tel": self.tel, "telText": self.tel_text, "text": self.blocks, "hrefs": self.hrefs}
+
+@dataclass
+class ParsedSerp:
+    phones: List[str] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+    blocked: bool = False  # consent/captcha/sorry: o chamador deve usar o browser
+
+def is_blocked_page(html: str, final_url: str = "") -> bool:
+    host = urllib.parse.urlsplit(final_url or "").netloc
+    if host.startswith("consent.") or "/sorry/" in (final_url or ""):
+        return True
+    txt = (html or "")[:120000].lower()
+    return any(s in txt for s in BLOCKED_SIGNALS)
+
+def parse_serp_html(html: str, final_url: str = "", *, max_links: int = 12) -> ParsedSerp:
+    """Função pura (testável com HTML salvo): telefones + links de fichas de uma SERP local."""
+    if is_blocked_page(html, final_url):
+        return ParsedSerp(blocked=True)
+    parser = _SerpHTMLParser()
+    try:
+        parser.feed(html or "")
+        parser.close()
+    except Exception:
+        pass  # HTML quebrado: fica com o que deu para ler
+    data = parser.payload()
+    links = list(dict.fromkeys(h for h in data["hrefs"] if h))[:max_links]
+    return ParsedSerp(phones=phones_from_dom_payload(data), links=links)
+
+# ---------- cliente compartilhado ----------
+_client: Optional[httpx.AsyncClient] = None
+
+def _new_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_keepalive_connections=int(settings.SCRAPER_HTTP_MAX_KEEPALIVE),
+        max_connections=int(settings.SCRAPER_HTTP_MAX_CONNECTIONS),
+    )
+    t = float(settings.SCRAPER_HTTP_TIMEOUT)
+    return httpx.AsyncClient(
+        http2=_HTTP2_AVAILABLE,
+        limits=limits,
+        timeout=httpx.Timeout(t, connect=t, read=t, write=t, pool=t),
+        follow_redirects=True,
+        headers={
+            "User-Agent": settings.USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "pt-BR,pt;q=0.9",
+        },
+        cookies={"CONSENT": "YES+cb"},
+    )
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    return _client
+
+async def fetch_serp(url: str, *, client: Optional[httpx.AsyncClient] = None) -> ParsedSerp:
+    """GET na URL da SERP; 429/403 contam como bloqueio. Erros de rede sobem como httpx.HTTPError."""
+    c = client or get_client()
+    r = await c.get(url)
+    if r.status_code in (403, 429):
+        return ParsedSerp(blocked=True)
+    r.raise_for_status()
+    return parse_serp_html(r.text, str(r.url))
+
+async def aclose() -> None:
+    global _client
+    c, _client = _client, None
+    if c is not None:
+        try:
+            await c.aclose()
+        except Exception:
+            pass
@@ -0,0 +1,197 @@
+# app/services/singleflight.py
+# Buscas idênticas ao mesmo tempo (nicho + cidades + verify normalizados) compartilham
+# um único LeadPipeline: quem chega depois recebe o que já saiu (replay) e segue ao vivo,
+# cada um cortado no próprio n. Um n maior sobe o alvo da busca em andamento.
+# Quem continua uma busca anterior (?cursor=) roda à parte: a varredura dele já está adiantada.
+import asyncio
+import re
+import time
+import unicodedata
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+from ..config import settings
+from .pipeline import Event, LeadPipeline
+from .scraper import ScrapeStats
+from . import scan_cursors
+
+Key = Tuple[str, str, bool]
+
+def _norm(text: str) -> str:
+    t = unicodedata.normalize("NFKD", text or "")
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", t).strip().lower()
+
+def run_key(nicho: str, cidades: List[str], verify: bool) -> Key:
+    return (_norm(nicho), ";".join(sorted(_norm(c) for c in cidades)), bool(verify))
+
+class SharedRun:
+    """Um pipeline + histórico dos eventos para replay."""
+
+    def __init__(
+        self, key: Optional[Key], nicho: str, cidades: List[str], n: int, verify: bool,
+        cursors: Optional[scan_cursors.Cursors] = None, cursor_id: Optional[str] = None,
+    ):
+        self.key = key
+        self.stats = ScrapeStats()
+        self.pipeline = LeadPipeline(nicho, cidades, n, verify=verify, stats=self.stats,
+                                     cursors=cursors, cursor_id=cursor_id)
+        self.events: List[Event] = []
+        self.finished = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self._task = asyncio.create_task(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            async for ev in self.pipeline.events():
+                self.events.append(ev)
+                async with self.changed:
+                    self.changed.notify_all()
+        finally:
+            self.finished = True
+            if self.key is not None and _runs.get(self.key) is self:
+                _runs.pop(self.key, None)
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def join(self, n: int) -> bool:
+        if self.finished or not await self.pipeline.raise_target(n):
+            return False
+        self.subscribers += 1
+        return True
+
+    def leave(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers <= 0 and not self.finished:
+            # ninguém mais ouvindo: para o scraping como antes (desconexão cancela o trabalho)
+            self._task.cancel()
+            if self.key is not None and _runs.get(self.key) is self:
+                _runs.pop(self.key, None)
+
+class Subscription:
+    """Visão de um cliente sobre um SharedRun: itens até o próprio n + resumo próprio."""
+
+    def __init__(self, run: SharedRun, n: int, joined: bool):
+        self.run = run
+        self.n = n
+        self.joined = joined  # pegou carona numa busca que já estava rodando
+        self.delivered = 0
+        self._cities_done: set = set()
+
+    @property
+    def stats(self) -> ScrapeStats:
+        return self.run.stats
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.run.pipeline.error
+
+    @property
+    def resumed(self) -> bool:
+        return self.run.pipeline.resumed
+
+    def summary(self) -> dict:
+        return {
+            **self.run.pipeline.summary(),
+            "wa_count": self.delivered,
+            "exhausted": self.delivered < self.n,
+        }
+
+    def _progress(self) -> Event:
+        p = self.run.pipeline
+        return ("progress", {
+            "wa_count": self.delivered, "non_wa_count": p.non_wa,
+            "searched": p.searched, "city": p.cidade,
+        })
+
+    def _close_cities(self) -> List[Event]:
+        # atingiu o próprio n antes do pipeline: fecha as cidades que ainda não viu terminar
+        p = self.run.pipeline
+        return [("city", {"status": "done", "name": c, **p.by_city[c]})
+                for c in p.cidades if c not in self._cities_done]
+
+    async def events(self, keepalive: Optional[float] = None) -> AsyncGenerator[Event, None]:
+        run = self.run
+        idx = 0
+        replay_upto = len(run.events)
+        last_beat = time.monotonic()
+        try:
+            while True:
+                while idx < len(run.events):
+                    kind, data = run.events[idx]
+                    idx += 1
+                    if kind == "item":
+                        if self.delivered >= self.n:
+                            continue
+                        self.delivered += 1
+                        yield kind, data
+                        if self.delivered >= self.n:
+                            yield self._progress()
+                            for ev in self._close_cities():
+                                yield ev
+                            return
+                    elif kind == "progress" and "error" not in data:
+                        if idx > replay_upto:
+                            yield self._progress()
+                    elif kind == "city" and data.get("status") == "progress":
+                        if idx > replay_upto:
+                            yield kind, data
+                    else:
+                        if kind == "city" and data.get("status") == "done":
+                            self._cities_done.add(data["name"])
+                        yield kind, data
+                    if idx == replay_upto and replay_upto:
+                        yield self._progress()  # fim do replay: um progress só, não o histórico todo
+                    last_beat = time.monotonic()
+                if run.finished:
+                    return
+                timed_out = False
+                async with run.changed:
+                    try:
+                        await asyncio.wait_for(
+                            run.changed.wait_for(lambda: run.finished or len(run.events) > idx),
+                            keepalive or None)
+                    except asyncio.TimeoutError:
+                        timed_out = True
+                if timed_out and time.monotonic() - last_beat >= keepalive:
+                    last_beat = time.monotonic()
+                    yield "tick", {"ts": int(time.time())}
+        finally:
+            run.leave()
+
+    async def collect(self) -> List[str]:
+        items: List[str] = []
+        async for kind, data in self.events():
+            if kind == "item":
+                items.append(data["phone"])
+        return items
+
+_runs: Dict[Key, SharedRun] = {}
+_counters = {"runs": 0, "joins": 0}
+
+async def subscribe(
+    nicho: str, cidades: List[str], n: int, *, verify: bool, cursor: Optional[str] = None,
+) -> Subscription:
+    """
+    Entra numa busca idêntica em andamento (se der para atender n) ou abre uma nova.
+    `cursor`: id devolvido no resumo de uma busca anterior; se ainda vale, continua dela.
+    """
+    resume = scan_cursors.take(cursor, nicho, cidades)
+    key = run_key(nicho, cidades, verify) if settings.SINGLEFLIGHT_ENABLED and resume is None else None
+    run = _runs.get(key) if key is not None else None
+    if run is not None and await run.join(n):
+        _counters["joins"] += 1
+        return Subscription(run, n, joined=True)
+    run = SharedRun(key, nicho, cidades, n, verify, resume, cursor if resume is not None else None)
+    run.subscribers = 1
+    if key is not None:
+        _runs[key] = run  # a anterior (se havia) segue para quem já estava nela
+    _counters["runs"] += 1
+    return Subscription(run, n, joined=False)
+
+def stats() -> dict:
+    return {
+        **_counters,
+        "active": len(_runs),
+        "subscribers": sum(r.subscribers for r in _runs.values()),
+    }
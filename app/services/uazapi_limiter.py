@@ -0,0 +1,145 @@
+# app/services/uazapi_limiter.py
+# Controle adaptativo da UAZAPI (AIMD): a concorrência cresce devagar enquanto a latência
+# fica abaixo do alvo e cai pela metade em 429/5xx/timeout. 429 respeita Retry-After
+# pausando as chamadas da instância. O tamanho do lote acompanha a latência dos lotes
+# quase cheios; lotes pequenos (custo fixo por chamada) não mexem nele.
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from ..config import settings
+
+def retry_after_secs(value: Optional[str]) -> Optional[float]:
+    """Retry-After em segundos ou data HTTP; None se ausente/ilegível."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+class AdaptiveLimiter:
+    DECREASE = 0.5       # corte multiplicativo em 429/5xx/timeout
+    SLOW_DECREASE = 0.9  # latência acima do alvo sem erro: corte suave
+    EWMA_ALPHA = 0.3
+    NEAR_FULL = 0.5      # fração do lote atual a partir da qual a latência ajusta o tamanho do lote
+
+    def __init__(
+        self,
+        initial: int,
+        max_limit: int,
+        target_latency_ms: float,
+        batch_size: int,
+        batch_min: int,
+        batch_max: int,
+    ):
+        self.max_limit = max(1, int(max_limit))
+        self.limit = float(min(self.max_limit, max(1, int(initial))))
+        self.target_latency = max(0.1, float(target_latency_ms) / 1000.0)
+        self.batch_min = max(1, int(batch_min))
+        self.batch_max = max(self.batch_min, int(batch_max))
+        self.batch = float(min(self.batch_max, max(self.batch_min, int(batch_size))))
+        self.inflight = 0
+        self.paused_until = 0.0
+        self.error_streak = 0
+        self.latency_ewma: Optional[float] = None
+        self.counters = {"ok": 0, "throttled": 0, "server_error": 0, "timeout": 0, "error": 0}
+        self._cond = asyncio.Condition()
+
+    # ---------- vaga ----------
+    @asynccontextmanager
+    async def slot(self):
+        async with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.inflight < int(self.limit):
+                    break
+                await self._cond.wait()
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.inflight -= 1
+                self._cond.notify_all()
+
+    def batch_size(self) -> int:
+        return int(self.batch)
+
+    # ---------- feedback ----------
+    def _observe_latency(self, secs: float, n: int) -> None:
+        # normaliza para o lote atual (só com lote quase cheio, então a escala é pequena)
+        per_batch = secs * self.batch / max(1, n)
+        a = self.EWMA_ALPHA
+        self.latency_ewma = per_batch if self.latency_ewma is None else a * per_batch + (1 - a) * self.latency_ewma
+
+    def on_success(self, secs: float, n: int) -> None:
+        self.counters["ok"] += 1
+        self.error_streak = 0
+        # lote pequeno (flush do timer com pouco tráfego) é quase só custo fixo por chamada:
+        # esticá-lo até o lote cheio pareceria sobrecarga. Ele só conta para a concorrência.
+        near_full = n >= self.batch * self.NEAR_FULL
+        if near_full:
+            self._observe_latency(secs, n)
+        latency = self.latency_ewma if near_full else secs
+        if latency <= self.target_latency:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)  # +1 por "janela"
+            if near_full and latency <= self.target_latency / 2:
+                self.batch = min(self.batch_max, self.batch * 1.1 + 1)
+        else:
+            self.limit = max(1.0, self.limit * self.SLOW_DECREASE)
+            if near_full:
+                self.batch = max(self.batch_min, self.batch * self.target_latency / latency)
+
+    def on_failure(self, kind: str, retry_after: Optional[float] = None) -> None:
+        """kind: throttled | server_error | timeout | error (rede)."""
+        self.counters[kind] = self.counters.get(kind, 0) + 1
+        self.error_streak += 1
+        self.limit = max(1.0, self.limit * self.DECREASE)
+        if kind == "timeout":
+            self.batch = max(self.batch_min, self.batch * self.DECREASE)
+        if kind == "throttled":
+            pause = retry_after if retry_after is not None else min(60.0, 2.0 ** self.error_streak)
+        elif kind in ("server_error", "timeout"):
+            pause = min(30.0, 0.5 * (2 ** (self.error_streak - 1))) + random.uniform(0, 0.25)
+        else:
+            pause = 0.0
+        if pause:
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    def state(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "max_limit": self.max_limit,
+            "inflight": self.inflight,
+            "batch_size": self.batch_size(),
+            "latency_ewma_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+            "target_latency_ms": round(self.target_latency * 1000),
+            "paused_for_sec": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "error_streak": self.error_streak,
+            **self.counters,
+        }
+
+def new_limiter(max_limit: Optional[int] = None) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        settings.UAZAPI_MAX_CONCURRENCY,
+        max_limit or settings.UAZAPI_CONCURRENCY_MAX,
+        settings.UAZAPI_TARGET_LATENCY_MS,
+        settings.UAZAPI_BATCH_SIZE,
+        settings.UAZAPI_BATCH_SIZE_MIN,
+        settings.UAZAPI_BATCH_SIZE_MAX,
+    )
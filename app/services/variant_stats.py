@@ -0,0 +1,105 @@
+# app/services/variant_stats.py
+# Rendimento histórico de cada padrão de variação de termo (ex.: "quoted+em_city_uf"):
+# páginas carregadas x telefones novos. O scraper usa para tentar primeiro os padrões
+# que mais rendem e desistir cedo dos que quase nunca trazem lead novo.
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Column, Integer, String, DateTime, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..auth import Base, SessionLocal, engine
+from ..config import settings
+
+class VariantYield(Base):
+    __tablename__ = "variant_stats"
+    pattern = Column(String(96), primary_key=True)
+    pages = Column(Integer, nullable=False, default=0)
+    new_phones = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+Base.metadata.create_all(engine)
+
+RELOAD_SEC = 300
+PRIOR_PAGES = 5  # peso do prior (média global) na média suavizada de cada padrão
+
+_history: Dict[str, Tuple[int, int]] = {}
+_loaded_at = 0.0
+_pending: Dict[str, List[int]] = {}
+_flush_lock = asyncio.Lock()
+
+def _load_sync() -> Dict[str, Tuple[int, int]]:
+    with SessionLocal() as s:
+        rows = s.execute(select(VariantYield.pattern, VariantYield.pages, VariantYield.new_phones)).all()
+        return {p: (int(pg or 0), int(nw or 0)) for p, pg, nw in rows}
+
+def _flush_sync(deltas: Dict[str, List[int]]) -> None:
+    with SessionLocal() as s:
+        for pattern, (pages, new) in deltas.items():
+            row = s.get(VariantYield, pattern)
+            if row is None:
+                row = VariantYield(pattern=pattern, pages=0, new_phones=0)
+                s.add(row)
+            row.pages = (row.pages or 0) + pages
+            row.new_phones = (row.new_phones or 0) + new
+            row.updated_at = datetime.utcnow()
+        s.commit()
+
+def record(pattern: str, new_phones: int) -> None:
+    acc = _pending.setdefault(pattern, [0, 0])
+    acc[0] += 1
+    acc[1] += int(new_phones)
+
+async def flush() -> None:
+    global _pending
+    async with _flush_lock:
+        deltas, _pending = _pending, {}
+        if not deltas:
+            return
+        try:
+            await asyncio.to_thread(_flush_sync, deltas)
+        except SQLAlchemyError:
+            # devolve para tentar de novo na próxima busca
+            for p, (pg, nw) in deltas.items():
+                acc = _pending.setdefault(p, [0, 0])
+                acc[0] += pg
+                acc[1] += nw
+            return
+        for p, (pg, nw) in deltas.items():
+            old_pg, old_nw = _history.get(p, (0, 0))
+            _history[p] = (old_pg + pg, old_nw + nw)
+
+async def snapshot() -> Dict[str, Tuple[int, int]]:
+    """{padrão: (páginas, telefones novos)} do banco, recarregado a cada RELOAD_SEC."""
+    global _history, _loaded_at
+    if time.monotonic() - _loaded_at > RELOAD_SEC:
+        try:
+            _history = await asyncio.to_thread(_load_sync)
+            _loaded_at = time.monotonic()
+        except SQLAlchemyError:
+            pass
+    return dict(_history)
+
+def _global_mean(history: Dict[str, Tuple[int, int]]) -> float:
+    pages = sum(pg for pg, _ in history.values())
+    new = sum(nw for _, nw in history.values())
+    return new / pages if pages else 1.0
+
+def score(history: Dict[str, Tuple[int, int]], pattern: str) -> float:
+    """Telefones novos por página, suavizado em direção à média global (padrão novo = média)."""
+    prior = _global_mean(history)
+    pages, new = history.get(pattern, (0, 0))
+    return (new + prior * PRIOR_PAGES) / (pages + PRIOR_PAGES)
+
+def is_low_yield(history: Dict[str, Tuple[int, int]], pattern: str) -> bool:
+    pages, _ = history.get(pattern, (0, 0))
+    if pages < int(settings.VARIANT_MIN_PAGES):
+        return False
+    return score(history, pattern) < _global_mean(history) * float(settings.VARIANT_LOW_YIELD_RATIO)
+
+def ranked(history: Dict[str, Tuple[int, int]]) -> List[dict]:
+    out = [{"pattern": p, "pages": pg, "new_phones": nw, "score": round(score(history, p), 3)}
+           for p, (pg, nw) in history.items()]
+    return sorted(out, key=lambda r: r["score"], reverse=True)
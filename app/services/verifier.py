@@ -1,7 +1,12 @@
 import asyncio
-from typing import Iterable, List, Tuple, Optional
+import time
+import urllib.parse
+from typing import AsyncGenerator, Dict, Iterable, List, Set, Tuple, Optional
 import httpx
 from ..config import settings
+from . import wa_cache, wa_probe
+from .uazapi_limiter import new_limiter, retry_after_secs
+from .circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
 
 CHECK_URL = settings.UAZAPI_CHECK_URL
 TOKEN = settings.UAZAPI_INSTANCE_TOKEN
@@ -14,7 +19,130 @@ except Exception:
     _HTTP2_AVAILABLE = False
 
 
-def _e164(n: str) -> Optional[str]:
+class VerificationUnavailable(RuntimeError):
+    """UAZAPI fora (disjuntor aberto). Leva o que já tinha veredito (cache/lotes que passaram)."""
+
+    def __init__(self, ok: Optional[List[str]] = None, bad: Optional[List[str]] = None, retry_in: float = 0.0):
+        super().__init__("verification unavailable")
+        self.ok = ok or []
+        self.bad = bad or []
+        self.retry_in = retry_in
+
+
+# ---------- instâncias UAZAPI (cada uma com limiter AIMD e disjuntor próprios) ----------
+class _Instance:
+    def __init__(self, name: str, url: str, token: str, max_concurrency: Optional[int] = None):
+        self.name = name
+        self.url = url
+        self.token = token
+        self.limiter = new_limiter(max_concurrency)
+        self.breaker = CircuitBreaker(
+            settings.UAZAPI_BREAKER_FAILURES,
+            settings.UAZAPI_BREAKER_OPEN_SEC,
+            settings.UAZAPI_BREAKER_HALF_OPEN_PROBES,
+        )
+        self.sent = 0  # números enviados
+
+    def available(self) -> bool:
+        st = self.breaker.state
+        return st == CLOSED or (st == HALF_OPEN and self.breaker.probes < self.breaker.half_open_probes)
+
+    def load(self) -> float:
+        return self.limiter.inflight / max(1.0, self.limiter.limit)
+
+    def state(self) -> dict:
+        return {
+            "name": self.name,
+            "host": urllib.parse.urlsplit(self.url).netloc,
+            "sent": self.sent,
+            "limiter": self.limiter.state(),
+            "breaker": self.breaker.snapshot(),
+        }
+
+
+def _parse_instances(raw: str) -> List[_Instance]:
+    """UAZAPI_INSTANCES: "url|token[|max_concorrência]" separados por vírgula ou quebra de linha."""
+    out: List[_Instance] = []
+    for entry in (raw or "").replace("\n", ",").split(","):
+        parts = [p.strip() for p in entry.split("|")]
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            continue
+        max_conc = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+        out.append(_Instance(f"uazapi-{len(out)}", parts[0], parts[1], max_conc))
+    return out
+
+
+_instances: List[_Instance] = _parse_instances(settings.UAZAPI_INSTANCES) or [
+    _Instance("uazapi-0", CHECK_URL, TOKEN)
+]
+
+
+def _pick_instance() -> _Instance:
+    """Menos carregada entre as saudáveis; pausada por 429 só se não houver outra."""
+    ready = [i for i in _instances if i.available()]
+    if not ready:
+        raise VerificationUnavailable(retry_in=_retry_in())
+    now = time.monotonic()
+    return min(ready, key=lambda i: (i.limiter.paused_until > now, i.load()))
+
+
+def _all_open() -> bool:
+    return all(i.breaker.is_open() for i in _instances)
+
+
+def _retry_in() -> float:
+    return min(i.breaker.retry_in() for i in _instances)
+
+
+def _batch_size() -> int:
+    sizes = [i.limiter.batch_size() for i in _instances if i.available()]
+    return min(sizes) if sizes else int(settings.UAZAPI_BATCH_SIZE)
+
+
+def instances_state() -> List[dict]:
+    return [i.state() for i in _instances]
+
+
+# ---------- clientes HTTP do processo (abertos/fechados no lifespan da app) ----------
+_client: Optional[httpx.AsyncClient] = None        # UAZAPI
+
+
+def _new_uazapi_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_keepalive_connections=int(settings.UAZAPI_MAX_KEEPALIVE),
+        max_connections=int(settings.UAZAPI_MAX_CONNECTIONS),
+        keepalive_expiry=float(settings.UAZAPI_KEEPALIVE_EXPIRY),
+    )
+    t = float(getattr(settings, "UAZAPI_TIMEOUT", 15))
+    timeout = httpx.Timeout(t, connect=t, read=t, write=t, pool=t)
+    return httpx.AsyncClient(http2=_HTTP2_AVAILABLE, limits=limits, timeout=timeout)
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_uazapi_client()  # fora do lifespan (scripts): cria sob demanda
+    return _client
+
+
+async def start_clients() -> None:
+    """Abre os clientes compartilhados por todas as requisições (chamado no startup)."""
+    _get_client()
+    wa_probe.get_client()
+
+
+async def close_clients() -> None:
+    global _client
+    c, _client = _client, None
+    if c is not None:
+        try:
+            await c.aclose()
+        except Exception:
+            pass
+    await wa_probe.aclose()
+
+
+def e164(n: str) -> Optional[str]:
     """Normaliza para E.164 simples: só dígitos, exige começando por 55 e 12~13 dígitos."""
     if not n:
         return None
@@ -36,29 +164,64 @@ def _chunks(seq: List[str], size: int):
 
 async def _check_once(client: httpx.AsyncClient, numbers: List[str]) -> Tuple[List[str], List[str], List[str]]:
     """
-    Chamada exata da UAZAPI:
-      POST {CHECK_URL}
+    Chamada exata da UAZAPI (na instância menos carregada):
+      POST {url da instância}
       headers: token
       body:   {"numbers": ["55...","55..."]}
     Resposta: lista com isInWhatsapp True/False.
 
-    Retorno: (ok, bad, unknown)
+    Retorno: (ok, bad, unknown). Passa pelo limiter e devolve a ele o tipo de falha
+    (429 + Retry-After, 5xx, timeout, rede) para ajustar concorrência e lote.
+    Sem instância com disjuntor fechado levanta VerificationUnavailable sem ir à rede.
     """
-    try:
-        r = await client.post(
-            CHECK_URL,
-            json={"numbers": numbers},
-            headers={
-                "Accept": "application/json",
-                "token": TOKEN,
-                "Content-Type": "application/json",
-            },
-        )
-        r.raise_for_status()
-        data = r.json() or []
-    except Exception:
-        # falhou o lote inteiro
-        return [], [], numbers[:]
+    inst = _pick_instance()
+    limiter, breaker = inst.limiter, inst.breaker
+    async with limiter.slot():
+        if not breaker.allow():
+            raise VerificationUnavailable(retry_in=_retry_in())
+        inst.sent += len(numbers)
+        t0 = time.monotonic()
+        try:
+            r = await client.post(
+                inst.url,
+                json={"numbers": numbers},
+                headers={
+                    "Accept": "application/json",
+                    "token": inst.token,
+                    "Content-Type": "application/json",
+                },
+            )
+        except httpx.TimeoutException:
+            limiter.on_failure("timeout")
+            breaker.on_failure()
+            return [], [], numbers[:]
+        except (httpx.HTTPError, Exception):
+            limiter.on_failure("error")
+            breaker.on_failure()
+            return [], [], numbers[:]
+        except BaseException:
+            breaker.release()  # cancelado (cliente saiu): não prende a sonda do half-open
+            raise
+
+        if r.status_code == 429:
+            # respondeu: está de pé, só pediu calma (quem cuida é o limiter)
+            limiter.on_failure("throttled", retry_after_secs(r.headers.get("Retry-After")))
+            breaker.on_success()
+            return [], [], numbers[:]
+        if r.status_code >= 500:
+            limiter.on_failure("server_error", retry_after_secs(r.headers.get("Retry-After")))
+            breaker.on_failure()
+            return [], [], numbers[:]
+        try:
+            r.raise_for_status()
+            data = r.json() or []
+        except Exception:
+            # 4xx/resposta ilegível: o lote inteiro fica sem veredito
+            limiter.on_failure("error")
+            breaker.on_failure()
+            return [], [], numbers[:]
+        limiter.on_success(time.monotonic() - t0, len(numbers))
+        breaker.on_success()
 
     ok, bad, unknown = [], [], []
     for item in data:
@@ -72,98 +235,254 @@ async def _check_once(client: httpx.AsyncClient, numbers: List[str]) -> Tuple[Li
     return ok, bad, unknown
 
 
-async def _wa_me_probe(client: httpx.AsyncClient, n: str) -> Optional[bool]:
+def _normalize(numbers: Iterable[str]) -> List[str]:
+    """de-dup + normalização E.164, mantendo a ordem."""
+    return list(dict.fromkeys(n for n in (e164(str(x)) for x in numbers if x) if n))
+
+
+async def _run_chunk(client: httpx.AsyncClient, chunk: List[str]) -> Tuple[List[str], List[str]]:
+    retries = max(0, int(getattr(settings, "UAZAPI_RETRIES", 3)))
+    delay = float(getattr(settings, "UAZAPI_THROTTLE_MS", 250)) / 1000.0
+
+    cur = chunk[:]
+    ok_all, bad_all = [], []
+    for attempt in range(retries + 1):
+        try:
+            ok, bad, unknown = await _check_once(client, cur)
+        except VerificationUnavailable:
+            if _all_open():
+                break  # tudo fora: não insiste, o resto fica sem veredito
+            await asyncio.sleep(delay)
+            continue  # outra instância (ou a sonda half-open) ainda pode atender
+        ok_all.extend(ok)
+        bad_all.extend(bad)
+        if not unknown:
+            break
+        if attempt == retries:
+            # esgotou: unknown NÃO vira bad; só abandona
+            break
+        await asyncio.sleep(delay)
+        cur = unknown[:]  # re-loteia só os que não definiram
+
+    return ok_all, bad_all
+
+
+async def verify_stream(
+    numbers: Iterable[str], *, batch_size: int | None = None
+) -> AsyncGenerator[Tuple[str, Optional[bool]], None]:
     """
-    Heurística leve: GET https://wa.me/<n>. Se o HTML contiver a mensagem
-    padrão de inválido, devolve False; caso contrário, True (best-effort).
+    Verifica números na UAZAPI em paralelo, espalhando os lotes pelas instâncias
+    (concorrência e lote vêm do limiter adaptativo de cada uma), e devolve
+    (telefone, tem_wa) assim que cada lote resolve — um lote lento não segura os outros.
+
+    - tem_wa None = sem veredito: NUNCA conta como não-WA.
+    - Retenta 'unknown' respeitando UAZAPI_RETRIES/UAZAPI_THROTTLE_MS.
+    - O segundo passe wa.me (WA_ME_SECOND_PASS=1) NÃO roda aqui: quem chama passa os 'bad'
+      para wa_probe.recover depois de entregar os 'ok'.
+    - Números com veredito recente no wa_cache saem primeiro, sem ir à rede.
+    - Todas as instâncias com disjuntor aberto: levanta VerificationUnavailable
+      (o que já tinha veredito saiu antes pelo gerador).
     """
+    dedup = _normalize(numbers)
+    if not dedup:
+        return
+
+    cached = await wa_cache.lookup(dedup)
+    for n in dedup:
+        if n in cached:
+            yield n, cached[n]
+    dedup = [n for n in dedup if n not in cached]
+    async for item in _verify_uncached(dedup, batch_size=batch_size):
+        yield item
+
+
+async def _verify_uncached(
+    dedup: List[str], *, batch_size: int | None = None
+) -> AsyncGenerator[Tuple[str, Optional[bool]], None]:
+    """Parte de rede de verify_stream: números já normalizados e que não estão no wa_cache."""
+    if not dedup:
+        return
+    if _all_open():
+        raise VerificationUnavailable(retry_in=_retry_in())
+
+    bs = batch_size or _batch_size()
+    client = _get_client()
+
+    async def resolve(chunk: List[str]):
+        ok, bad = await _run_chunk(client, chunk)
+        return chunk, ok, bad
+
+    tasks = [asyncio.create_task(resolve(c)) for c in _chunks(dedup, bs)]
+    unresolved = 0
     try:
-        r = await client.get(f"https://wa.me/{n}", timeout=10.0)
-        txt = (r.text or "").lower()
-        # mensagens comuns (pt/en) que indicam número inválido
-        signals = [
-            "phone number shared via url is invalid",
-            "o número de telefone compartilhado via url é inválido",
-            "número de telefone via url é inválido",
-        ]
-        if any(s in txt for s in signals):
-            return False
-        return True
-    except Exception:
-        return None
+        for next_done in asyncio.as_completed(tasks):
+            chunk, ok, bad = await next_done
+            await wa_cache.store(ok, bad)
+            for n in ok:
+                yield n, True
+            for n in bad:
+                yield n, False
+            answered = set(ok) | set(bad)
+            for n in chunk:
+                if n not in answered:
+                    unresolved += 1
+                    yield n, None
+    finally:
+        for t in tasks:
+            t.cancel()
+    if unresolved and _all_open():
+        raise VerificationUnavailable(retry_in=_retry_in())
 
 
 async def verify_batch(numbers: Iterable[str], *, batch_size: int | None = None) -> Tuple[List[str], List[str]]:
+    """verify_stream inteiro de uma vez: (ok, bad). Sem veredito fica de fora das duas listas."""
+    ok: List[str] = []
+    bad: List[str] = []
+    try:
+        async for n, has_wa in verify_stream(numbers, batch_size=batch_size):
+            if has_wa is True:
+                ok.append(n)
+            elif has_wa is False:
+                bad.append(n)
+    except VerificationUnavailable as e:
+        raise VerificationUnavailable(ok, bad, e.retry_in) from None
+    return ok, bad
+
+
+# ---------- micro-batcher entre requisições ----------
+_UNAVAILABLE = "unavailable"  # resultado do future quando o disjuntor abriu
+
+
+class _MicroBatcher:
+    """
+    Junta números pendentes de TODOS os streams em lotes cheios (UAZAPI_BATCH_SIZE).
+    Dispara ao encher o lote ou após UAZAPI_BATCH_MAX_WAIT_MS do primeiro pendente.
+    Cada número tem um único future; quem pediu o mesmo número espera o mesmo resultado.
     """
-    Verifica números na UAZAPI em paralelo.
 
-    - NUNCA conta 'unknown' como não-WA.
-    - Retenta 'unknown' respeitando UAZAPI_RETRIES/UAZAPI_THROTTLE_MS.
-    - Opcionalmente, revalida os 'bad' com wa.me se WA_ME_SECOND_PASS=1.
+    def __init__(self):
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()  # referência forte: o GC não pode levar um lote em voo
+        self.batches = 0
+        self.numbers = 0
+        self.joined = 0  # números que pegaram carona num future já existente
+
+    def _size(self) -> int:
+        return max(1, _batch_size())
+
+    def _future_for(self, n: str) -> asyncio.Future:
+        fut = self._inflight.get(n) or self._pending.get(n)
+        if fut is not None:
+            self.joined += 1
+            return fut
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[n] = fut
+        return fut
+
+    def _schedule(self) -> None:
+        size = self._size()
+        while len(self._pending) >= size:
+            self._flush(size)
+        if self._pending and self._timer is None:
+            wait = max(0.0, float(settings.UAZAPI_BATCH_MAX_WAIT_MS) / 1000.0)
+            self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        size = self._size()
+        while self._pending:
+            self._flush(size)
+
+    def _flush(self, size: int) -> None:
+        batch: Dict[str, asyncio.Future] = {}
+        for n in list(self._pending)[:size]:
+            batch[n] = self._pending.pop(n)
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._inflight.update(batch)
+        self.batches += 1
+        self.numbers += len(batch)
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, asyncio.Future]) -> None:
+        missing = None  # valor de quem ficou sem veredito
+        try:
+            # o chamador (verify_batched_stream) já consultou o wa_cache para estes números
+            async for n, has_wa in _verify_uncached(list(batch), batch_size=len(batch)):
+                fut = batch.get(n)
+                if fut is not None and not fut.done():
+                    fut.set_result(has_wa)
+        except VerificationUnavailable:
+            missing = _UNAVAILABLE
+        except Exception:
+            pass  # erro: fica 'unknown' (None), nunca vira não-WA
+        for n, fut in batch.items():
+            self._inflight.pop(n, None)
+            if not fut.done():
+                fut.set_result(missing)
+
+    def enqueue(self, numbers: List[str]) -> Dict[str, asyncio.Future]:
+        futs = {n: self._future_for(n) for n in numbers}
+        self._schedule()
+        return futs
+
+    def state(self) -> dict:
+        return {
+            "pending": len(self._pending), "inflight": len(self._inflight),
+            "batches": self.batches, "numbers": self.numbers, "joined": self.joined,
+            "avg_batch": round(self.numbers / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+_batcher = _MicroBatcher()
+
+
+async def verify_batched_stream(numbers: Iterable[str]) -> AsyncGenerator[Tuple[str, Optional[bool]], None]:
     """
-    # de-dup + normalização
-    seen, dedup = set(), []
-    for raw in (str(x) for x in numbers if x):
-        n = _e164(raw)
-        if not n:
-            continue
-        if n not in seen:
-            seen.add(n)
-            dedup.append(n)
+    Como verify_stream, mas passando pelo micro-batcher do processo: números de vários
+    streams viram poucos POSTs cheios. Cache sai na hora; o resto, à medida que cada lote volta.
+    """
+    dedup = _normalize(numbers)
     if not dedup:
-        return [], []
+        return
+    cached = await wa_cache.lookup(dedup)
+    for n in dedup:
+        if n in cached:
+            yield n, cached[n]
+    misses = [n for n in dedup if n not in cached]
+    if not misses:
+        return
+    if _all_open():
+        raise VerificationUnavailable(retry_in=_retry_in())
+    if not settings.UAZAPI_MICROBATCH:
+        async for item in _verify_uncached(misses, batch_size=len(misses)):
+            yield item
+        return
 
-    bs = batch_size or int(getattr(settings, "UAZAPI_BATCH_SIZE", 50))
+    async def wait(n: str, fut: asyncio.Future):
+        # shield: cancelar um chamador não pode cancelar o future que outros streams esperam
+        return n, await asyncio.shield(fut)
+
+    waiters = [asyncio.create_task(wait(n, f)) for n, f in _batcher.enqueue(misses).items()]
+    unavailable = False
+    try:
+        for next_done in asyncio.as_completed(waiters):
+            n, res = await next_done
+            if res == _UNAVAILABLE:
+                unavailable = True
+                continue
+            yield n, res
+    finally:
+        for t in waiters:
+            t.cancel()
+    if unavailable:
+        raise VerificationUnavailable(retry_in=_retry_in())
 
-    limits = httpx.Limits(max_keepalive_connections=10, max_connections=20)
-    t = float(getattr(settings, "UAZAPI_TIMEOUT", 15))
-    timeout = httpx.Timeout(t, connect=t, read=t, write=t, pool=t)
 
-    async with httpx.AsyncClient(http2=_HTTP2_AVAILABLE, limits=limits, timeout=timeout) as client:
-        sem = asyncio.Semaphore(int(getattr(settings, "UAZAPI_MAX_CONCURRENCY", 2)))
-
-        async def run_chunk(chunk: List[str]):
-            retries = max(0, int(getattr(settings, "UAZAPI_RETRIES", 3)))
-            delay = float(getattr(settings, "UAZAPI_THROTTLE_MS", 250)) / 1000.0
-
-            cur = chunk[:]
-            ok_all, bad_all = [], []
-            for attempt in range(retries + 1):
-                ok, bad, unknown = await _check_once(client, cur)
-                ok_all.extend(ok)
-                bad_all.extend(bad)
-                if not unknown:
-                    break
-                if attempt == retries:
-                    # esgotou: unknown NÃO vira bad; só abandona
-                    break
-                await asyncio.sleep(delay)
-                cur = unknown[:]  # re-loteia só os que não definiram
-
-            # segundo passe opcional para recuperar falsos negativos
-            if bad_all and str(getattr(settings, "WA_ME_SECOND_PASS", "0")) == "1":
-                probe_ok = []
-                # pequena limitação para não estourar tempo
-                wa_me_limits = httpx.Limits(max_keepalive_connections=5, max_connections=10)
-                async with httpx.AsyncClient(limits=wa_me_limits, timeout=10.0) as probe_client:
-                    tasks = [asyncio.create_task(_wa_me_probe(probe_client, b)) for b in bad_all]
-                    results = await asyncio.gather(*tasks, return_exceptions=False)
-                for i, res in enumerate(results):
-                    if res is True:
-                        probe_ok.append(bad_all[i])
-                if probe_ok:
-                    # move os que "parecem WA" pelo wa.me do bad -> ok
-                    ok_all.extend(probe_ok)
-                    bad_all = [b for b in bad_all if b not in set(probe_ok)]
-
-            return ok_all, bad_all
-
-        tasks = [asyncio.create_task(run_chunk(c)) for c in _chunks(dedup, bs)]
-        results = await asyncio.gather(*tasks, return_exceptions=False)
-
-    ok_final: List[str] = []
-    bad_final: List[str] = []
-    for ok, bad in results:
-        ok_final.extend(ok)
-        bad_final.extend(bad)
-    return ok_final, bad_final
+def batcher_state() -> dict:
+    return _batcher.state()
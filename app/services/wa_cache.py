@@ -0,0 +1,121 @@
+# app/services/wa_cache.py
+# Cache de status WhatsApp por telefone (E.164 só dígitos) na frente da UAZAPI.
+# Dois níveis: LRU em memória + tabela no engine do auth. TTL separado para
+# positivo (tem WA) e negativo (não tem), já que o negativo muda com mais frequência.
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import Column, String, Boolean, DateTime, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..auth import Base, SessionLocal, engine
+from ..config import settings
+
+class WaStatus(Base):
+    __tablename__ = "wa_status"
+    phone = Column(String(20), primary_key=True)
+    has_wa = Column(Boolean, nullable=False)
+    checked_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+Base.metadata.create_all(engine)
+
+_mem: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()  # phone -> (has_wa, checked_at epoch)
+_counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "writes": 0}
+
+def _ttl(has_wa: bool) -> float:
+    return float(settings.WA_CACHE_TTL_POSITIVE_SEC if has_wa else settings.WA_CACHE_TTL_NEGATIVE_SEC)
+
+def _fresh(has_wa: bool, checked_at: float, now: float) -> bool:
+    return now - checked_at <= _ttl(has_wa)
+
+def _mem_put(phone: str, has_wa: bool, checked_at: float) -> None:
+    _mem[phone] = (has_wa, checked_at)
+    _mem.move_to_end(phone)
+    while len(_mem) > max(1, int(settings.WA_CACHE_MEMORY_MAX)):
+        _mem.popitem(last=False)
+
+def _db_get_sync(phones: List[str]) -> Dict[str, Tuple[bool, float]]:
+    out: Dict[str, Tuple[bool, float]] = {}
+    with SessionLocal() as s:
+        for i in range(0, len(phones), 500):
+            rows = s.execute(
+                select(WaStatus.phone, WaStatus.has_wa, WaStatus.checked_at)
+                .where(WaStatus.phone.in_(phones[i:i + 500]))
+            ).all()
+            for phone, has_wa, checked_at in rows:
+                out[phone] = (bool(has_wa), checked_at.replace(tzinfo=timezone.utc).timestamp())
+    return out
+
+def _db_put_sync(items: Dict[str, bool], checked_at: datetime) -> None:
+    with SessionLocal() as s:
+        for phone, has_wa in items.items():
+            row = s.get(WaStatus, phone)
+            if row is None:
+                s.add(WaStatus(phone=phone, has_wa=has_wa, checked_at=checked_at))
+            else:
+                row.has_wa = has_wa
+                row.checked_at = checked_at
+        try:
+            s.commit()
+        except SQLAlchemyError:
+            s.rollback()
+
+async def lookup(phones: Iterable[str]) -> Dict[str, bool]:
+    """{telefone: tem_wa} só para os que têm veredito dentro do TTL."""
+    phones = list(dict.fromkeys(phones))
+    if not settings.WA_CACHE_ENABLED or not phones:
+        return {}
+    now = time.time()
+    found: Dict[str, bool] = {}
+    pending: List[str] = []
+    for p in phones:
+        item = _mem.get(p)
+        if item is not None and _fresh(item[0], item[1], now):
+            _mem.move_to_end(p)
+            found[p] = item[0]
+        else:
+            pending.append(p)
+    _counters["memory_hits"] += len(found)
+
+    if pending:
+        try:
+            rows = await asyncio.to_thread(_db_get_sync, pending)
+        except SQLAlchemyError:
+            rows = {}
+        for p, (has_wa, checked_at) in rows.items():
+            if _fresh(has_wa, checked_at, now):
+                found[p] = has_wa
+                _mem_put(p, has_wa, checked_at)
+                _counters["db_hits"] += 1
+    _counters["misses"] += len(phones) - len(found)
+    return found
+
+async def store(ok: Iterable[str], bad: Iterable[str]) -> None:
+    if not settings.WA_CACHE_ENABLED:
+        return
+    items = {p: True for p in ok if p}
+    items.update({p: False for p in bad if p and p not in items})
+    if not items:
+        return
+    now_ts = time.time()
+    now = datetime.utcfromtimestamp(now_ts)
+    for p, has_wa in items.items():
+        _mem_put(p, has_wa, now_ts)
+    try:
+        await asyncio.to_thread(_db_put_sync, items, now)
+        _counters["writes"] += len(items)
+    except SQLAlchemyError:
+        pass  # o nível em memória já tem o veredito
+
+def stats() -> dict:
+    hits = _counters["memory_hits"] + _counters["db_hits"]
+    total = hits + _counters["misses"]
+    return {
+        **_counters,
+        "enabled": bool(settings.WA_CACHE_ENABLED),
+        "memory_size": len(_mem),
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+    }
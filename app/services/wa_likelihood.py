@@ -0,0 +1,86 @@
+# app/services/wa_likelihood.py
+# Chance de um número ter WhatsApp antes de gastar UAZAPI com ele: classe do número
+# (celular 9xxxx, celular antigo de 8 dígitos, fixo) + taxa histórica por classe e DDD,
+# tirada dos vereditos já gravados no wa_status. O pipeline verifica os prováveis primeiro.
+import asyncio
+import time
+from typing import Dict, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..auth import SessionLocal
+from .wa_cache import WaStatus
+
+RELOAD_SEC = 600
+CLASS_WEIGHT = 20  # peso do prior fixo na taxa da classe
+DDD_WEIGHT = 10    # peso da taxa da classe na taxa de classe+DDD
+
+# prior sem histórico nenhum
+CLASS_PRIOR = {"mobile": 0.7, "mobile_legacy": 0.45, "landline": 0.08, "other": 0.2}
+
+Counts = Dict[object, Tuple[int, int]]  # chave -> (verificados, com WA)
+
+_by_class: Counts = {}
+_by_ddd: Counts = {}
+_loaded_at = 0.0
+
+def _national(phone: str) -> str:
+    d = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    return d[2:] if d.startswith("55") and len(d) >= 12 else d
+
+def _class_of(size: int, lead: str) -> str:
+    """size = dígitos após o 55 (DDD incluso); lead = 1º dígito do assinante."""
+    if size == 11:
+        return "mobile" if lead == "9" else "other"
+    if size == 10:
+        return "mobile_legacy" if lead in "6789" else "landline" if lead in "2345" else "other"
+    return "other"
+
+def number_class(phone: str) -> str:
+    nat = _national(phone)
+    return _class_of(len(nat), nat[2:3])
+
+def _load_sync() -> Tuple[Counts, Counts]:
+    size = func.length(WaStatus.phone) - 2
+    ddd = func.substr(WaStatus.phone, 3, 2)
+    lead = func.substr(WaStatus.phone, 5, 1)
+    hits = func.sum(case((WaStatus.has_wa.is_(True), 1), else_=0))
+    with SessionLocal() as s:
+        rows = s.execute(select(size, ddd, lead, func.count(), hits).group_by(size, ddd, lead)).all()
+    by_class: Dict[str, list] = {}
+    by_ddd: Dict[Tuple[str, str], list] = {}
+    for sz, d, ld, n, h in rows:
+        cls = _class_of(int(sz or 0), ld or "")
+        for acc in (by_class.setdefault(cls, [0, 0]), by_ddd.setdefault((cls, d), [0, 0])):
+            acc[0] += int(n or 0)
+            acc[1] += int(h or 0)
+    return ({k: tuple(v) for k, v in by_class.items()}, {k: tuple(v) for k, v in by_ddd.items()})
+
+async def refresh() -> None:
+    """Recarrega as taxas do banco no máximo a cada RELOAD_SEC."""
+    global _by_class, _by_ddd, _loaded_at
+    if time.monotonic() - _loaded_at <= RELOAD_SEC:
+        return
+    try:
+        _by_class, _by_ddd = await asyncio.to_thread(_load_sync)
+        _loaded_at = time.monotonic()
+    except SQLAlchemyError:
+        pass
+
+def _smooth(counts: Tuple[int, int], prior: float, weight: int) -> float:
+    n, hits = counts
+    return (hits + prior * weight) / (n + weight)
+
+def score(phone: str) -> float:
+    """Probabilidade estimada (0..1) de ter WhatsApp."""
+    nat = _national(phone)
+    cls = _class_of(len(nat), nat[2:3])
+    class_rate = _smooth(_by_class.get(cls, (0, 0)), CLASS_PRIOR[cls], CLASS_WEIGHT)
+    return _smooth(_by_ddd.get((cls, nat[:2]), (0, 0)), class_rate, DDD_WEIGHT)
+
+def stats() -> dict:
+    return {
+        cls: {"verified": n, "wa_rate": round(_smooth((n, h), CLASS_PRIOR[cls], CLASS_WEIGHT), 3)}
+        for cls, (n, h) in sorted(_by_class.items())
+    }
@@ -0,0 +1,134 @@
+# app/services/wa_probe.py
+# Segundo passe via wa.me (WA_ME_SECOND_PASS=1): tenta recuperar falsos negativos da UAZAPI.
+# Roda DEPOIS dos vereditos principais, com teto global de concorrência, cliente compartilhado
+# e cache próprio de resultados. O wa.me é heurística fraca: o veredito dele NUNCA vai para o
+# wa_cache (que guarda só o da UAZAPI e alimenta o wa_likelihood).
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from ..config import settings
+
+INVALID_SIGNALS = (
+    "phone number shared via url is invalid",
+    "o número de telefone compartilhado via url é inválido",
+    "número de telefone via url é inválido",
+)
+
+_client: Optional[httpx.AsyncClient] = None
+_sem: Optional[asyncio.Semaphore] = None
+_results: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()  # phone -> (parece WA, quando)
+_inflight: Dict[str, asyncio.Future] = {}
+_counters = {"probes": 0, "cache_hits": 0, "recovered": 0, "errors": 0}
+
+def enabled() -> bool:
+    return str(getattr(settings, "WA_ME_SECOND_PASS", "0")) == "1"
+
+def _new_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_keepalive_connections=int(settings.WA_ME_MAX_KEEPALIVE),
+        max_connections=int(settings.WA_ME_MAX_CONNECTIONS),
+        keepalive_expiry=float(settings.UAZAPI_KEEPALIVE_EXPIRY),
+    )
+    return httpx.AsyncClient(limits=limits, timeout=10.0)
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    return _client
+
+async def aclose() -> None:
+    global _client
+    c, _client = _client, None
+    if c is not None:
+        try:
+            await c.aclose()
+        except Exception:
+            pass
+
+def _slots() -> asyncio.Semaphore:
+    global _sem
+    if _sem is None:
+        _sem = asyncio.Semaphore(max(1, int(settings.WA_ME_CONCURRENCY)))
+    return _sem
+
+async def _wa_me_probe(client: httpx.AsyncClient, n: str) -> Optional[bool]:
+    """
+    Heurística leve: GET https://wa.me/<n>. Se o HTML contiver a mensagem
+    padrão de inválido, devolve False; caso contrário, True (best-effort).
+    """
+    try:
+        r = await client.get(f"https://wa.me/{n}", timeout=10.0)
+        txt = (r.text or "").lower()
+        if any(s in txt for s in INVALID_SIGNALS):
+            return False
+        return True
+    except Exception:
+        return None
+
+def _cached(n: str) -> Optional[bool]:
+    item = _results.get(n)
+    if item is None:
+        return None
+    if time.time() - item[1] > float(settings.WA_ME_CACHE_TTL_SEC):
+        _results.pop(n, None)
+        return None
+    _results.move_to_end(n)
+    return item[0]
+
+def _remember(n: str, looks_wa: bool) -> None:
+    _results[n] = (looks_wa, time.time())
+    _results.move_to_end(n)
+    while len(_results) > max(1, int(settings.WA_ME_CACHE_MAX)):
+        _results.popitem(last=False)
+
+async def _probe_one(n: str) -> Optional[bool]:
+    async with _slots():
+        _counters["probes"] += 1
+        return await _wa_me_probe(get_client(), n)
+
+async def probe(n: str) -> Optional[bool]:
+    """Resultado do wa.me para um número (cache → probe em voo → rede)."""
+    hit = _cached(n)
+    if hit is not None:
+        _counters["cache_hits"] += 1
+        return hit
+    fut = _inflight.get(n)
+    if fut is not None:
+        return await asyncio.shield(fut)
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[n] = fut
+    res: Optional[bool] = None
+    try:
+        res = await _probe_one(n)
+        if res is None:
+            _counters["errors"] += 1
+        else:
+            _remember(n, res)
+    finally:
+        _inflight.pop(n, None)
+        if not fut.done():
+            fut.set_result(res)
+    return res
+
+async def recover(bad: Iterable[str]) -> List[str]:
+    """Dos 'bad' da UAZAPI, devolve os que o wa.me indica ter WA (só no cache deste módulo)."""
+    nums = list(dict.fromkeys(n for n in bad if n))
+    if not nums:
+        return []
+    results = await asyncio.gather(*(probe(n) for n in nums))
+    found = [n for n, res in zip(nums, results) if res is True]
+    _counters["recovered"] += len(found)
+    return found
+
+def stats() -> dict:
+    return {
+        **_counters,
+        "enabled": enabled(),
+        "inflight": len(_inflight),
+        "cache_size": len(_results),
+    }
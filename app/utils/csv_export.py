@@ -0,0 +1,20 @@
+# app/utils/csv_export.py
+from typing import AsyncIterable, AsyncGenerator
+
+from fastapi.responses import StreamingResponse
+
+def export_filename(nicho: str, cidade: str) -> str:
+    return f"leads_{nicho.strip().replace(' ','_')}_{cidade.replace(' ','_')}.csv"
+
+async def _csv_rows(phones: AsyncIterable[str]) -> AsyncGenerator[str, None]:
+    yield "phone\n"
+    async for p in phones:
+        yield str(p).strip() + "\n"
+
+def csv_stream_response(phones: AsyncIterable[str], filename: str) -> StreamingResponse:
+    """CSV linha a linha (chunked): o cliente recebe cada telefone assim que ele sai."""
+    return StreamingResponse(
+        _csv_rows(phones),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
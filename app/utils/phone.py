@@ -29,3 +29,19 @@ def normalize_br(s: str) -> str | None:
         return f"+{BR_DIAL_CODE}{d}"
     # Sometimes numbers appear without DDD. Reject.
     return None
+
+def phones_from_dom_payload(data: dict) -> list[str]:
+    """
+    Telefones de um payload {tel, telText, text} (script da página ou parser HTML):
+    hrefs/textos de tel: normalizados um a um e o texto dos blocos parseado uma vez só.
+    """
+    phones = set()
+    for h in data.get("tel") or []:
+        n = normalize_br((h or "").replace("tel:", ""))
+        if n: phones.add(n)
+    for t in data.get("telText") or []:
+        n = normalize_br(t)
+        if n: phones.add(n)
+    # separador sem espaço/dígito: o regex aceita \s entre partes e não pode colar blocos vizinhos
+    phones.update(extract_phones_from_text("\n|\n".join(data.get("text") or [])))
+    return list(phones)
@@ -0,0 +1,10 @@
+# app/utils/sse.py
+import json
+from typing import Optional
+
+KEEPALIVE_SEC = 10  # “tick” periódico no SSE para evitar ficar mudo
+
+def sse(event: str, data: dict, id: Optional[int] = None) -> str:
+    """Um evento SSE; com `id` o navegador reenvia Last-Event-ID ao reconectar."""
+    head = f"id: {id}\n" if id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,50 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# banco do auth fora do repositório (o import de app.auth cria as tabelas)
+os.environ.setdefault("AUTH_DB_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "auth.db"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+def read_fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+class _FakeGoogle(BaseHTTPRequestHandler):
+    """/search?q=...: 'consent' devolve a tela de consentimento, 'limit' um 429, o resto a SERP salva."""
+
+    def do_GET(self):
+        q = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get("q", [""])[0]
+        if "limit" in q:
+            self.send_response(429)
+            self.end_headers()
+            return
+        body = read_fixture("serp_consent.html" if "consent" in q else "serp_local.html").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def fake_google():
+    """Servidor local no lugar do Google (mesma ideia de SCRAPER_GOOGLE_BASE_URL)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeGoogle)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,20 @@
+# tests/test_city_terms.py
+from app.services.pipeline import cidade_from_local, cidades_from_local
+from app.services.scraper import _city_parts, _city_variants
+
+def _terms(local: str):
+    return [t for _, t in _city_variants(cidade_from_local(local))]
+
+def test_typed_uf_reaches_the_terms():
+    terms = _terms("São Paulo, SP")
+    assert "São Paulo SP" in terms and "São Paulo, SP" in terms
+    assert not any("MG" in t for t in terms)
+    assert _city_parts(cidade_from_local("Curitiba, PR")) == ("Curitiba", "PR")
+
+def test_full_city_name_alias_and_default_uf():
+    assert _city_parts("São Paulo") == ("São Paulo", "SP")
+    assert _city_parts("Contagem") == ("Contagem", "MG")  # SCRAPER_DEFAULT_UF
+    assert cidade_from_local("Centro, Belo Horizonte") == "Centro"
+
+def test_region_cities_keep_their_uf():
+    assert cidades_from_local("grande sp")[:2] == ["São Paulo, SP", "Guarulhos, SP"]
@@ -0,0 +1,36 @@
+# tests/test_pipeline.py
+import asyncio
+
+from app.services import pipeline
+from app.services.scraper import ScanCursor
+
+LANDLINES = [f"+55313222{i:04d}" for i in range(4)]  # improváveis: ficam para o fim
+MOBILES = [f"+55319{i:08d}" for i in range(12)]
+
+async def _fake_scrape(nicho, locais, target, *, max_pages=None, stats=None, cursor=None):
+    for ph in (LANDLINES + MOBILES)[:target]:
+        await asyncio.sleep(0)
+        if ph not in cursor.seen:
+            cursor.seen.add(ph)
+            yield ph
+
+async def _all_wa(numbers):
+    for n in numbers:
+        await asyncio.sleep(0)
+        yield pipeline.e164(n), True
+
+def test_unused_phones_go_back_to_the_cursor(monkeypatch):
+    monkeypatch.setattr(pipeline, "scrape_numbers", _fake_scrape)
+    monkeypatch.setattr(pipeline, "verify_batched_stream", _all_wa)
+    cursor = ScanCursor()
+    pipe = pipeline.LeadPipeline("pizzaria", ["Belo Horizonte, MG"], 3, verify=True,
+                                 cursors={"Belo Horizonte, MG": cursor})
+
+    delivered = asyncio.run(pipe.collect())
+
+    assert len(delivered) == 3
+    left = set(cursor.pending)
+    assert set(LANDLINES) <= left  # adiados nunca verificados
+    assert {"+" + p for p in delivered}.isdisjoint(left)
+    assert cursor.seen == left | {"+" + p for p in delivered}
+    assert pipe.summary()["cursor"] == pipe.cursor_id
@@ -0,0 +1,28 @@
+# tests/test_serp_cache.py
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.auth import SessionLocal
+from app.services import serp_cache
+from app.services.serp_cache import SerpPageCache
+
+def _age(term: str, seconds: int) -> None:
+    with SessionLocal() as s:
+        s.execute(update(SerpPageCache).where(SerpPageCache.term == term)
+                  .values(created_at=datetime.utcnow() - timedelta(seconds=seconds)))
+        s.commit()
+
+def test_empty_page_expires_before_full_page():
+    async def run():
+        await serp_cache.put("vazio", "", 0, [], [])
+        await serp_cache.put("cheio", "", 0, ["+5581998765432"], [])
+        assert await serp_cache.get("vazio", "", 0) == ([], [])
+        _age("vazio", 3600)
+        _age("cheio", 3600)
+        return await serp_cache.get("vazio", "", 0), await serp_cache.get("cheio", "", 0)
+
+    empty, full = asyncio.run(run())
+    assert empty is None
+    assert full == (["+5581998765432"], [])
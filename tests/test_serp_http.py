@@ -0,0 +1,66 @@
+# tests/test_serp_http.py
+import asyncio
+
+from conftest import read_fixture
+
+from app.services import serp_http
+from app.services.scraper import ScrapeStats, _HttpEngine
+
+SERP_PHONES = {"+5581998765432", "+558132221100", "+5581991234567"}
+
+def test_parse_saved_serp():
+    parsed = serp_http.parse_serp_html(read_fixture("serp_local.html"), "https://www.google.com/search?tbm=lcl")
+    assert not parsed.blocked
+    # script/style/noscript não contam
+    assert set(parsed.phones) == SERP_PHONES
+    assert len(parsed.links) == 3
+    assert any("ludocid=" in h for h in parsed.links)
+    assert any("/maps/place" in h for h in parsed.links)
+    assert not any("start=20" in h for h in parsed.links)
+
+def test_consent_page_is_blocked():
+    html = read_fixture("serp_consent.html")
+    assert serp_http.parse_serp_html(html).blocked
+    assert serp_http.parse_serp_html(read_fixture("serp_local.html"), "https://consent.google.com/m?x=1").blocked
+    assert serp_http.parse_serp_html("<html></html>", "https://www.google.com/sorry/index").blocked
+
+def test_fetch_serp_from_local_server(fake_google):
+    async def run():
+        async with serp_http._new_client() as client:
+            ok = await serp_http.fetch_serp(f"{fake_google}/search?tbm=lcl&q=pizzaria", client=client)
+            limited = await serp_http.fetch_serp(f"{fake_google}/search?tbm=lcl&q=limit", client=client)
+        return ok, limited
+
+    ok, limited = asyncio.run(run())
+    assert set(ok.phones) == SERP_PHONES and not ok.blocked
+    assert limited.blocked and not limited.phones
+
+class _StubBrowser:
+    def __init__(self):
+        self.stats = ScrapeStats()
+        self.urls = []
+
+    async def fetch(self, url):
+        self.urls.append(url)
+        return ["+5581900000000"], [], False
+
+    async def close(self):
+        pass
+
+def test_http_engine_falls_back_to_browser_on_consent(fake_google):
+    async def run(q):
+        browser = _StubBrowser()
+        engine = _HttpEngine(browser)
+        try:
+            phones, hrefs, captcha = await engine.fetch(f"{fake_google}/search?tbm=lcl&q={q}")
+        finally:
+            await serp_http.aclose()
+        return browser, phones
+
+    browser, phones = asyncio.run(run("consent"))
+    assert browser.urls and phones == ["+5581900000000"]
+    assert browser.stats.http_fallbacks == 1 and browser.stats.http_pages == 0
+
+    browser, phones = asyncio.run(run("pizzaria"))
+    assert not browser.urls and set(phones) == SERP_PHONES
+    assert browser.stats.http_pages == 1 and browser.stats.http_fallbacks == 0
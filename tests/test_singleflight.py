@@ -0,0 +1,46 @@
+# tests/test_singleflight.py
+import asyncio
+
+from app.services import pipeline, singleflight
+
+def _fake_scrape(release: asyncio.Event, head: int = 10):
+    """Varredura sem fim: numera pelo `seen` do cursor (retomar continua a sequência)."""
+
+    async def scrape_numbers(nicho, locais, target, *, max_pages=None, stats=None, cursor=None):
+        for _ in range(target):
+            if len(cursor.seen) >= head:
+                await release.wait()
+            await asyncio.sleep(0)
+            ph = f"+55319{len(cursor.seen):08d}"
+            cursor.seen.add(ph)
+            yield ph
+
+    return scrape_numbers
+
+async def _first_items(sub, k: int):
+    gen = sub.events()
+    got = 0
+    async for kind, _ in gen:
+        got += kind == "item"
+        if got >= k:
+            return gen
+
+async def _drain(gen):
+    return [data["phone"] async for kind, data in gen if kind == "item"]
+
+def test_joiner_with_larger_n_raises_a_running_scrape(monkeypatch):
+    async def run():
+        release = asyncio.Event()
+        monkeypatch.setattr(pipeline, "scrape_numbers", _fake_scrape(release))
+        first = await singleflight.subscribe("pizzaria", ["Recife, PE"], 150, verify=False)
+        first_gen = await _first_items(first, 5)  # a 1ª passada já começou com o teto de n=150
+        second = await singleflight.subscribe("pizzaria", ["Recife, PE"], 300, verify=False)
+        assert second.joined
+        release.set()
+        a, b = await asyncio.gather(_drain(first_gen), second.collect())
+        return first, second, 5 + len(a), b
+
+    first, second, got_first, got_second = asyncio.run(run())
+    assert got_first == 150 and not first.summary()["exhausted"]
+    assert len(got_second) == 300 and len(set(got_second)) == 300
+    assert not second.summary()["exhausted"]
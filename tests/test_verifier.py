@@ -0,0 +1,26 @@
+# tests/test_verifier.py
+import asyncio
+import json
+
+import httpx
+
+from app.services import verifier, wa_cache
+
+def _fake_uazapi(request: httpx.Request) -> httpx.Response:
+    numbers = json.loads(request.content)["numbers"]
+    return httpx.Response(200, json=[{"query": n, "isInWhatsapp": n.endswith("1")} for n in numbers])
+
+def test_batched_stream_looks_up_the_cache_once(monkeypatch):
+    monkeypatch.setattr(verifier, "_client", httpx.AsyncClient(transport=httpx.MockTransport(_fake_uazapi)))
+    phones = ["+5531990001111", "+5531990002222", "+5531990003331"]
+
+    async def run():
+        try:
+            return [item async for item in verifier.verify_batched_stream(phones)]
+        finally:
+            await verifier.close_clients()
+
+    misses = wa_cache.stats()["misses"]
+    got = dict(asyncio.run(run()))
+    assert got == {"5531990001111": True, "5531990002222": False, "5531990003331": True}
+    assert wa_cache.stats()["misses"] - misses == 3